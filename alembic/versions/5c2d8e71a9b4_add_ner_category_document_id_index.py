@@ -0,0 +1,27 @@
+"""add (ner_category, document_id) index to document_named_entities
+
+Revision ID: 5c2d8e71a9b4
+Revises: 3f19b80f425b
+Create Date: 2026-10-17 09:12:41.503127
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2d8e71a9b4'
+down_revision = '3f19b80f425b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_document_named_entities_ner_category_document_id",
+        "document_named_entities",
+        ["ner_category", "document_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_document_named_entities_ner_category_document_id", table_name="document_named_entities")
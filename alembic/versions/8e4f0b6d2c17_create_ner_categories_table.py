@@ -0,0 +1,32 @@
+"""create ner_categories table
+
+Revision ID: 8e4f0b6d2c17
+Revises: 5c2d8e71a9b4
+Create Date: 2026-10-17 10:03:12.284519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f0b6d2c17'
+down_revision = '5c2d8e71a9b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ner_categories",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement="ignore_fk"),
+        sa.Column("ner_category", sa.String(100), unique=True)
+    )
+    op.execute(
+        "INSERT INTO ner_categories (ner_category) "
+        "SELECT DISTINCT ner_category FROM document_named_entities WHERE ner_category IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ner_categories")
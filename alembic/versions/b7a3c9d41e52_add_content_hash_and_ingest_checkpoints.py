@@ -0,0 +1,76 @@
+"""add documents.content_hash and create ingest_checkpoints table
+
+Revision ID: b7a3c9d41e52
+Revises: 8e4f0b6d2c17
+Create Date: 2026-10-17 11:21:05.917346
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7a3c9d41e52'
+down_revision = '8e4f0b6d2c17'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    op.add_column("documents", sa.Column("content_hash", sa.String(64), nullable=True))
+    backfill_content_hash()
+    op.create_index("ix_documents_content_hash", "documents", ["content_hash"], unique=True)
+
+    op.create_table(
+        "ingest_checkpoints",
+        sa.Column("source", sa.String(100), primary_key=True),
+        sa.Column("source_offset", sa.Integer()),
+        sa.Column("updated_at", sa.DateTime())
+    )
+
+
+def backfill_content_hash() -> None:
+    """ hash the text of the existing documents. Only the first document of each text gets its hash, the duplicates
+    left by earlier reruns keep a NULL content_hash so that the unique index can be created.
+
+    :return:
+    """
+    conn = op.get_bind()
+    documents = sa.table("documents", sa.column("id", sa.Integer()), sa.column("text", sa.Text()),
+                         sa.column("content_hash", sa.String(64)))
+    seen_hashes = set()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(documents.c.id, documents.c.text)
+            .where(documents.c.id > last_id)
+            .order_by(documents.c.id.asc())
+            .limit(BACKFILL_BATCH_SIZE)
+        ).fetchall()
+        if len(rows) == 0:
+            break
+
+        updates = []
+        for id, text in rows:
+            content_hash = hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+            if content_hash not in seen_hashes:
+                seen_hashes.add(content_hash)
+                updates.append(dict(document_id=id, content_hash=content_hash))
+        if len(updates) > 0:
+            conn.execute(
+                documents.update().where(documents.c.id == sa.bindparam("document_id"))
+                .values(content_hash=sa.bindparam("content_hash")),
+                updates
+            )
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    op.drop_table("ingest_checkpoints")
+    op.drop_index("ix_documents_content_hash", table_name="documents")
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.drop_column("content_hash")
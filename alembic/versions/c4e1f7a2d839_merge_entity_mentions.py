@@ -0,0 +1,138 @@
+"""merge document_named_entities tokens into entity mentions, with their surface text
+
+Revision ID: c4e1f7a2d839
+Revises: b7a3c9d41e52
+Create Date: 2026-10-17 21:42:37.530194
+
+"""
+from typing import Iterable, List, Text, Tuple
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1f7a2d839'
+down_revision = 'b7a3c9d41e52'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 200
+# the merge rules below are a frozen copy of the ones of models.models.NERSpan at this revision, a migration must not
+# change when the application code does
+ENTITY_TEXT_SIZE = 255
+
+
+def upgrade() -> None:
+    op.add_column("document_named_entities", sa.Column("entity_text", sa.String(ENTITY_TEXT_SIZE), nullable=True))
+    op.add_column("document_named_entities", sa.Column("entity_key", sa.String(ENTITY_TEXT_SIZE), nullable=True))
+    backfill_entity_mentions()
+    op.create_index("ix_document_named_entities_entity_key", "document_named_entities",
+                    ["entity_key", "ner_category", "document_id"])
+
+
+def backfill_entity_mentions() -> None:
+    """ replace the token spans of the existing documents with one span per entity mention, BACKFILL_BATCH_SIZE
+    documents at a time. The surface text of each mention is cut out of its document text.
+
+    :return:
+    """
+    conn = op.get_bind()
+    documents = sa.table("documents", sa.column("id", sa.Integer()), sa.column("text", sa.Text()))
+    document_named_entities = sa.table(
+        "document_named_entities",
+        sa.column("id", sa.Integer()),
+        sa.column("document_id", sa.Integer()),
+        sa.column("start_span", sa.Integer()),
+        sa.column("end_span", sa.Integer()),
+        sa.column("ner_tag", sa.String(100)),
+        sa.column("ner_category", sa.String(100)),
+        sa.column("entity_text", sa.String(ENTITY_TEXT_SIZE)),
+        sa.column("entity_key", sa.String(ENTITY_TEXT_SIZE))
+    )
+    last_id = 0
+    while True:
+        texts = dict(conn.execute(
+            sa.select(documents.c.id, documents.c.text)
+            .where(documents.c.id > last_id)
+            .order_by(documents.c.id.asc())
+            .limit(BACKFILL_BATCH_SIZE)
+        ).fetchall())
+        if len(texts) == 0:
+            break
+
+        raw_ne_spans_by_document = {}
+        for document_id, start_span, end_span, ner_tag in conn.execute(
+            sa.select(document_named_entities.c.document_id, document_named_entities.c.start_span,
+                      document_named_entities.c.end_span, document_named_entities.c.ner_tag)
+            .where(document_named_entities.c.document_id.in_(list(texts.keys())))
+            .order_by(document_named_entities.c.document_id.asc(), document_named_entities.c.start_span.asc(),
+                      document_named_entities.c.id.asc())
+        ):
+            raw_ne_spans_by_document.setdefault(document_id, []).append((start_span, end_span, ner_tag))
+
+        mentions = []
+        for document_id, raw_ne_spans in raw_ne_spans_by_document.items():
+            text = texts[document_id] or ""
+            for start_span, end_span, ner_category in merge_mentions(raw_ne_spans):
+                entity_text = text[start_span:end_span][:ENTITY_TEXT_SIZE]
+                mentions.append(dict(
+                    document_id=document_id,
+                    start_span=start_span,
+                    end_span=end_span,
+                    ner_tag=ner_category,
+                    ner_category=ner_category,
+                    entity_text=entity_text,
+                    entity_key=entity_key_of(entity_text)
+                ))
+        if len(mentions) > 0:
+            conn.execute(document_named_entities.delete().where(
+                document_named_entities.c.document_id.in_(list(raw_ne_spans_by_document.keys()))
+            ))
+            conn.execute(document_named_entities.insert(), mentions)
+        last_id = max(texts.keys())
+
+
+def merge_mentions(raw_ne_spans: Iterable[Tuple[int, int, Text]]) -> List[Tuple[int, int, Text]]:
+    """ merge the BIOES or BIO tagged token spans of each entity mention into a single span
+
+    :param raw_ne_spans: (start_span, end_span, ner_tag) tuples of one document, in text order
+    :return: (start_span, end_span, ner_category) tuple of each mention
+    """
+    mentions: List[Tuple[int, int, Text]] = []
+    mention = None
+    for start_span, end_span, ner_tag in raw_ne_spans:
+        prefix, _, ner_category = ner_tag.rpartition("-")
+        if prefix in ("I", "E") and mention is not None and mention[2] == ner_category:
+            mention = (mention[0], end_span, ner_category)
+        else:
+            if mention is not None:
+                mentions.append(mention)
+            mention = (start_span, end_span, ner_category)
+        if prefix not in ("B", "I"):
+            mentions.append(mention)
+            mention = None
+    if mention is not None:
+        mentions.append(mention)
+    return mentions
+
+
+def entity_key_of(entity_text: str) -> str:
+    """ case folded entity_text, with whitespace runs collapsed into a single space
+
+    :param entity_text:
+    :return:
+    """
+    return " ".join(entity_text.split()).casefold()[:ENTITY_TEXT_SIZE]
+
+
+def downgrade() -> None:
+    """ the token spans that were merged into mentions are not kept, the token boundaries inside a mention cannot be
+    restored
+
+    :return:
+    """
+    raise NotImplementedError(
+        "c4e1f7a2d839 merged the token spans of document_named_entities into entity mentions and cannot be reverted, "
+        "restore a backup taken before upgrading or rerun the ingestion on the previous revision instead"
+    )
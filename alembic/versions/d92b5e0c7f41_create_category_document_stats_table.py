@@ -0,0 +1,37 @@
+"""create category_document_stats table
+
+Revision ID: d92b5e0c7f41
+Revises: c4e1f7a2d839
+Create Date: 2026-10-17 22:31:08.104726
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd92b5e0c7f41'
+down_revision = 'c4e1f7a2d839'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "category_document_stats",
+        sa.Column("ner_category", sa.String(100), primary_key=True),
+        sa.Column("document_count", sa.Integer(), nullable=False, default=0),
+        sa.Column("mention_count", sa.Integer(), nullable=False, default=0)
+    )
+    op.execute(
+        "INSERT INTO category_document_stats (ner_category, document_count, mention_count) "
+        "SELECT ner_categories.ner_category, COUNT(DISTINCT document_named_entities.document_id), "
+        "COUNT(document_named_entities.id) "
+        "FROM ner_categories LEFT JOIN document_named_entities "
+        "ON document_named_entities.ner_category = ner_categories.ner_category "
+        "GROUP BY ner_categories.ner_category"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("category_document_stats")
@@ -0,0 +1,82 @@
+"""add documents.text_compressed, for document text stored zlib compressed
+
+Existing documents are only compressed when the DOCUMENT_TEXT_COMPRESSION environment variable is zlib, the
+repository reads both kinds of rows.
+
+Revision ID: e5b8a3f1c6d2
+Revises: d92b5e0c7f41
+Create Date: 2026-10-17 23:12:46.381950
+
+"""
+import os
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8a3f1c6d2'
+down_revision = 'd92b5e0c7f41'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 200
+
+documents = sa.table(
+    "documents",
+    sa.column("id", sa.Integer()),
+    sa.column("text", sa.Text()),
+    sa.column("text_compressed", sa.LargeBinary())
+)
+
+
+def upgrade() -> None:
+    op.add_column("documents", sa.Column("text_compressed", sa.LargeBinary(), nullable=True))
+    if os.environ.get("DOCUMENT_TEXT_COMPRESSION", "none") != "zlib":
+        return
+
+    conn = op.get_bind()
+    for rows in _batches(conn, documents.c.text):
+        conn.execute(
+            documents.update().where(documents.c.id == sa.bindparam("b_id")).values(
+                text=None, text_compressed=sa.bindparam("b_text_compressed")
+            ),
+            [dict(b_id=document_id, b_text_compressed=zlib.compress(text.encode("utf-8"), 6)) for document_id, text in rows]
+        )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    for rows in _batches(conn, documents.c.text_compressed):
+        conn.execute(
+            documents.update().where(documents.c.id == sa.bindparam("b_id")).values(
+                text=sa.bindparam("b_text"), text_compressed=None
+            ),
+            [dict(b_id=document_id, b_text=zlib.decompress(compressed_text).decode("utf-8"))
+             for document_id, compressed_text in rows]
+        )
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.drop_column("text_compressed")
+
+
+def _batches(conn, column):
+    """ (id, column) of the documents where column is not null, BACKFILL_BATCH_SIZE documents at a time
+
+    :param conn:
+    :param column: documents.c.text or documents.c.text_compressed
+    :return:
+    """
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(documents.c.id, column)
+            .where(documents.c.id > last_id)
+            .where(column.isnot(None))
+            .order_by(documents.c.id.asc())
+            .limit(BACKFILL_BATCH_SIZE)
+        ).fetchall()
+        if len(rows) == 0:
+            break
+        yield rows
+        last_id = rows[-1][0]
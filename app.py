@@ -1,13 +1,52 @@
+import json
+import time
+
 import flask
 from flask import Flask, request, jsonify
 from flask_cors import CORS, cross_origin
 
-from services.services import WebServiceImpl
+from http_payloads import InvalidPageArgs, category_stats_data, documents_data, is_page_request, page_args
+from metrics.metrics import HTTP_REQUEST_SECONDS, HTTP_SERIALIZATION_SECONDS, metrics_response
+from repositories.category_query import InvalidCategoryQuery, parse_category_query
+from services.web_services import WebServiceImpl
 
 app = Flask(__name__)
 cors = CORS(app, resources={r"*": {"origins": "*"}})
 
-web_service = WebServiceImpl.instance()
+web_service = WebServiceImpl.instance(use_category_index=True)
+
+
+@app.before_request
+def start_request_timer():
+    flask.g.request_start = time.perf_counter()
+
+
+def observe_request_time(status_code):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUEST_SECONDS.labels(route=route, method=request.method, status=status_code).observe(
+        time.perf_counter() - flask.g.request_start
+    )
+
+
+@app.after_request
+def record_request_time(response):
+    # the body of a streamed response is not sent yet, its generator records the time once it is
+    if not response.is_streamed:
+        observe_request_time(response.status_code)
+    return response
+
+
+def timed_jsonify(**kwargs):
+    with HTTP_SERIALIZATION_SECONDS.labels(route=request.url_rule.rule).time():
+        return jsonify(kwargs)
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """ timing histograms and counters of this process, in prometheus text format
+    """
+    body, content_type = metrics_response()
+    return flask.Response(body, content_type=content_type)
 
 
 @app.route("/ner/related", methods=["GET"])
@@ -33,10 +72,25 @@ def get_related_ner_category():
         ]
     }
     ```
+
+    with `with_counts=true`, each category comes with its number of documents and mentions, for faceted search
+    ```
+    {
+        "data": [
+            {"ner_category": "LAW", "document_count": 12, "mention_count": 31}
+        ]
+    }
+    ```
     """
     search_term = request.args.get("query")
-    related_ner_categories = web_service.retrieve_related_ner_categories(search_term=search_term)
-    response = jsonify(dict(data=related_ner_categories))
+    if request.args.get("with_counts", "false").lower() == "true":
+        related_ner_categories = [
+            category_stats_data(stats)
+            for stats in web_service.retrieve_related_ner_category_stats(search_term=search_term)
+        ]
+    else:
+        related_ner_categories = web_service.retrieve_related_ner_categories(search_term=search_term)
+    response = timed_jsonify(data=related_ner_categories)
     response.headers["Access-Control-Allow-Origin"] = "*"
     return response
 
@@ -55,10 +109,122 @@ def get_related_document_by_ner_category():
         response = jsonify(dict(data=[]))
         return response
 
+    try:
+        parse_category_query(ner_category)
+    except InvalidCategoryQuery as e:
+        return jsonify(dict(error=str(e))), 400
+
+    if is_page_request(request_payload):
+        return get_related_document_page(ner_category, request_payload)
+
+    if request_payload.get("stream", False):
+        return stream_related_documents(ner_category)
+
     related_documents = web_service.retrieve_related_documents(ner_category)
-    response = jsonify(dict(data=[{"id": doc.id, "text": doc.text} for doc in related_documents]))
+    response = timed_jsonify(data=[{"id": doc.id, "text": doc.text} for doc in related_documents])
+    return response
+
+
+def get_related_document_page(ner_category, request_payload):
+    """ Paginated document search, used when the payload of /documents/search has a limit, an after or a snippet_size
+
+    sample request payload
+    ```
+    {
+        "ner_category": "LAW",
+        "limit": 2,
+        "after": 3,
+        "snippet_size": 40
+    }
+    ```
+
+    sample response, pass "next" as "after" to get the next page, it is null on the last page
+    ```
+    {
+        "data": [
+            {"id": 4, "offset": 120, "text": "...signed the Affordable Care Act in 2010..."},
+            {"id": 5, "offset": 0, "text": "The deaths of three American soldiers in"}
+        ],
+        "next": 5
+    }
+    ```
+    """
+    try:
+        limit, after, snippet_size = page_args(request_payload)
+    except InvalidPageArgs as e:
+        return jsonify(dict(error=str(e))), 400
+    related_documents, next_cursor = web_service.retrieve_related_documents_page(
+        ner_category, after=after, limit=limit, snippet_size=snippet_size
+    )
+    response = timed_jsonify(data=documents_data(related_documents), next=next_cursor)
     return response
 
 
+@app.route("/entities/search", methods=["POST", "OPTIONS"])
+@cross_origin(origin='*')
+def get_documents_by_entity():
+    """ Paginated search of the documents that mention an entity, by its text, regardless of case and whitespace.
+    ner_category is optional, it restricts the search to mentions of this category. limit, after and snippet_size are
+    the same as the paginated /documents/search, snippets are centered around the first mention of the entity.
+
+    sample request payload
+    ```
+    {
+        "entity": "Obama",
+        "ner_category": "PERSON",
+        "limit": 2,
+        "snippet_size": 40
+    }
+    ```
+
+    sample response
+    ```
+    {
+        "data": [
+            {"id": 4, "offset": 80, "text": "...said President Obama in a statement..."},
+            {"id": 9, "offset": 0, "text": "Obama is expected to visit Berlin this"}
+        ],
+        "next": 9
+    }
+    ```
+    """
+    if request.method == "OPTIONS":
+        response = flask.Response()
+        return response
+
+    request_payload = request.get_json()
+    entity_text = request_payload.get("entity") or ""
+    if len(entity_text.strip()) == 0:
+        return jsonify(dict(data=[], next=None))
+
+    try:
+        limit, after, snippet_size = page_args(request_payload)
+    except InvalidPageArgs as e:
+        return jsonify(dict(error=str(e))), 400
+    documents, next_cursor = web_service.retrieve_documents_by_entity_page(
+        entity_text, ner_category=request_payload.get("ner_category") or None, after=after, limit=limit,
+        snippet_size=snippet_size
+    )
+    response = timed_jsonify(data=documents_data(documents), next=next_cursor)
+    return response
+
+
+def stream_related_documents(ner_category):
+    """ Streamed document search, used when the payload of /documents/search has "stream": true. The response body is
+    the same as the non streamed one, but documents are written as they are read from the db, so the whole result set
+    is never held in memory.
+    """
+    def generate():
+        try:
+            yield '{"data": ['
+            for i, doc in enumerate(web_service.iter_related_documents(ner_category)):
+                yield ("," if i > 0 else "") + json.dumps({"id": doc.id, "text": doc.text})
+            yield "]}"
+        finally:
+            observe_request_time(200)
+
+    return flask.Response(flask.stream_with_context(generate()), mimetype="application/json")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5002)
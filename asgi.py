@@ -0,0 +1,178 @@
+""" ASGI version of app.py, with the same /ner/related, /documents/search and /entities/search contracts, served by an
+event loop on top of async db connections instead of one thread per request.
+
+```
+uvicorn asgi:app --host 0.0.0.0 --port 5002
+```
+"""
+import json
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+from http_payloads import InvalidPageArgs, category_stats_data, documents_data, is_page_request, page_args
+from metrics.metrics import HTTP_REQUEST_SECONDS, HTTP_SERIALIZATION_SECONDS, metrics_response
+from repositories.category_query import InvalidCategoryQuery, parse_category_query
+from services.async_services import AsyncWebServiceImpl
+
+web_service = AsyncWebServiceImpl()
+
+
+async def startup():
+    await web_service.init(is_test=os.environ.get("ASGI_TEST_DB", "0") == "1")
+
+
+def route_template(request: Request) -> str:
+    """ path template of the route that serves request, or "unmatched", so that the route label of the metrics is
+    bounded by the routes of the app rather than by the paths clients send, same as app.record_request_time
+    """
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match != Match.NONE:
+            return route.path
+    return "unmatched"
+
+
+def observe_request_time(request: Request, status_code: int):
+    HTTP_REQUEST_SECONDS.labels(route=route_template(request), method=request.method,
+                                status=status_code).observe(time.perf_counter() - request.state.request_start)
+
+
+async def record_request_time(request: Request, call_next):
+    request.state.request_start = time.perf_counter()
+    response = await call_next(request)
+    # the body of a streamed response is not sent yet, its generator records the time once it is
+    if not getattr(request.state, "streamed", False):
+        observe_request_time(request, response.status_code)
+    return response
+
+
+def timed_json_response(request: Request, content) -> JSONResponse:
+    """ see app.timed_jsonify, the body of a JSONResponse is serialized when it is created
+    """
+    with HTTP_SERIALIZATION_SECONDS.labels(route=route_template(request)).time():
+        return JSONResponse(content)
+
+
+async def get_metrics(request: Request):
+    """ see app.get_metrics
+    """
+    body, content_type = metrics_response()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+async def get_related_ner_category(request: Request):
+    """ Used by autocomplete function, see app.get_related_ner_category
+    """
+    search_term = request.query_params.get("query")
+    if request.query_params.get("with_counts", "false").lower() == "true":
+        related_ner_categories = [
+            category_stats_data(stats)
+            for stats in await web_service.retrieve_related_ner_category_stats(search_term=search_term)
+        ]
+    else:
+        related_ner_categories = await web_service.retrieve_related_ner_categories(search_term=search_term)
+    return timed_json_response(request, dict(data=related_ner_categories))
+
+
+async def get_related_document_by_ner_category(request: Request):
+    """ see app.get_related_document_by_ner_category
+    """
+    if request.method == "OPTIONS":
+        return Response()
+
+    request_payload = await request.json()
+    ner_category = request_payload.get("ner_category")
+
+    if len(ner_category) == 0:
+        return JSONResponse(dict(data=[]))
+
+    try:
+        parse_category_query(ner_category)
+    except InvalidCategoryQuery as e:
+        return JSONResponse(dict(error=str(e)), status_code=400)
+
+    if is_page_request(request_payload):
+        return await get_related_document_page(request, ner_category, request_payload)
+
+    if request_payload.get("stream", False):
+        return stream_related_documents(request, ner_category)
+
+    related_documents = await web_service.retrieve_related_documents(ner_category)
+    return timed_json_response(request, dict(data=[{"id": doc.id, "text": doc.text} for doc in related_documents]))
+
+
+async def get_related_document_page(request: Request, ner_category, request_payload):
+    """ see app.get_related_document_page
+    """
+    try:
+        limit, after, snippet_size = page_args(request_payload)
+    except InvalidPageArgs as e:
+        return JSONResponse(dict(error=str(e)), status_code=400)
+    related_documents, next_cursor = await web_service.retrieve_related_documents_page(
+        ner_category, after=after, limit=limit, snippet_size=snippet_size
+    )
+    return timed_json_response(request, dict(data=documents_data(related_documents), next=next_cursor))
+
+
+async def get_documents_by_entity(request: Request):
+    """ see app.get_documents_by_entity
+    """
+    if request.method == "OPTIONS":
+        return Response()
+
+    request_payload = await request.json()
+    entity_text = request_payload.get("entity") or ""
+    if len(entity_text.strip()) == 0:
+        return JSONResponse(dict(data=[], next=None))
+
+    try:
+        limit, after, snippet_size = page_args(request_payload)
+    except InvalidPageArgs as e:
+        return JSONResponse(dict(error=str(e)), status_code=400)
+    documents, next_cursor = await web_service.retrieve_documents_by_entity_page(
+        entity_text, ner_category=request_payload.get("ner_category") or None, after=after, limit=limit,
+        snippet_size=snippet_size
+    )
+    return timed_json_response(request, dict(data=documents_data(documents), next=next_cursor))
+
+
+def stream_related_documents(request: Request, ner_category):
+    """ see app.stream_related_documents
+    """
+    request.state.streamed = True
+
+    async def generate():
+        try:
+            yield '{"data": ['
+            i = 0
+            async for doc in web_service.iter_related_documents(ner_category):
+                yield ("," if i > 0 else "") + json.dumps({"id": doc.id, "text": doc.text})
+                i += 1
+            yield "]}"
+        finally:
+            observe_request_time(request, 200)
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+
+app = Starlette(
+    routes=[
+        Route("/metrics", get_metrics, methods=["GET"]),
+        Route("/ner/related", get_related_ner_category, methods=["GET"]),
+        Route("/documents/search", get_related_document_by_ner_category, methods=["POST", "OPTIONS"]),
+        Route("/entities/search", get_documents_by_entity, methods=["POST", "OPTIONS"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(BaseHTTPMiddleware, dispatch=record_request_time)
+    ],
+    on_startup=[startup]
+)
@@ -0,0 +1,199 @@
+""" Offline benchmarks of ingestion throughput and query latency, on a sqlite db filled with synthetic data.
+
+```
+python -m benchmarks.bench --output bench.json
+python -m benchmarks.bench --sizes 10000 --output new.json --baseline bench.json
+```
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import sqlalchemy
+
+from benchmarks.synthetic import NER_CATEGORIES, NER_CATEGORY_WEIGHTS, SyntheticScrapperService, \
+    StubNERExtractionService, synthetic_spans, synthetic_texts
+from models.models import Document
+from repositories.repositories import SQLDocumentRepositoryImpl, SQLNERSpanRepository
+from services.services import ScrapyScrapperService, StanzaNERExtractionService, process
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+SPANS_PER_DOC = 10
+# number of spans per store_many call when filling the db
+SPAN_CHUNK_SIZE = 50_000
+# number of documents per find_by_ids call, the default page size of the web api
+FIND_BY_IDS_SIZE = 20
+
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return dict(
+        n=len(latencies),
+        p50_ms=latencies[int(0.50 * (len(latencies) - 1))] * 1000,
+        p99_ms=latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+        mean_ms=sum(latencies) / len(latencies) * 1000
+    )
+
+
+def _measure(func: Callable, args_list: List[tuple]) -> Dict[str, float]:
+    latencies: List[float] = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return _latency_summary(latencies)
+
+
+def bench_ingestion(database: str, n_docs: int, batch_size: int, seed: int) -> Dict[str, float]:
+    """ run process() over n_docs synthetic documents with a stubbed NER stage, and measure the throughput of each
+    of its stages in documents/sec.
+
+    :param database: path of the sqlite db
+    :param n_docs:
+    :param batch_size:
+    :param seed:
+    :return:
+    """
+    scrapper_service = SyntheticScrapperService(synthetic_texts(n_docs, seed=seed), database=database)
+    ne_service = StubNERExtractionService(database=database)
+    scrapper_service.empty_db()
+    ne_service.empty_db()
+
+    instances = ScrapyScrapperService.INSTANCE, StanzaNERExtractionService.INSTANCE
+    ScrapyScrapperService.INSTANCE, StanzaNERExtractionService.INSTANCE = scrapper_service, ne_service
+    try:
+        start = time.perf_counter()
+        timer = process(is_test=False, batch_size=batch_size, offset=0, limit=None)
+        total_seconds = time.perf_counter() - start
+    finally:
+        ScrapyScrapperService.INSTANCE, StanzaNERExtractionService.INSTANCE = instances
+
+    results = {f"{stage}_docs_per_sec": timer.documents[stage] / seconds for stage, seconds in timer.seconds.items()}
+    results["process_docs_per_sec"] = n_docs / total_seconds
+    scrapper_service.empty_db()
+    ne_service.empty_db()
+    return results
+
+
+def bench_queries(database: str, n_spans: int, n_queries: int, seed: int) -> Dict[str, Dict[str, float]]:
+    """ fill the db with n_spans synthetic spans over n_spans / SPANS_PER_DOC documents, measuring insert throughput,
+    then measure the latency of the queries of the web api.
+
+    :param database: path of the sqlite db
+    :param n_spans:
+    :param n_queries: number of calls of each query
+    :param seed:
+    :return:
+    """
+    document_repository = SQLDocumentRepositoryImpl.instance(host="", database=database, engine="sqlite")
+    ner_repository = SQLNERSpanRepository.instance(host="", database=database, engine="sqlite")
+    document_repository.truncate()
+    ner_repository.truncate()
+
+    now = datetime.now()
+    docs = [Document(date=now, text=text) for text in synthetic_texts(n_spans // SPANS_PER_DOC, seed=seed, html=False)]
+    start = time.perf_counter()
+    document_repository.store_many(docs)
+    document_seconds = time.perf_counter() - start
+
+    spans = synthetic_spans(docs, spans_per_doc=SPANS_PER_DOC, seed=seed)
+    span_seconds = 0.0
+    while True:
+        chunk = [span for _, span in zip(range(SPAN_CHUNK_SIZE), spans)]
+        if len(chunk) == 0:
+            break
+        start = time.perf_counter()
+        ner_repository.store_many(chunk)
+        span_seconds += time.perf_counter() - start
+
+    rng = random.Random(seed)
+    ids = [doc.id for doc in docs]
+    del docs
+    results = dict(
+        inserts=dict(
+            documents_per_sec=len(ids) / document_seconds,
+            spans_per_sec=n_spans / span_seconds
+        ),
+        find_related_ner_categories=_measure(ner_repository.find_related_ner_categories, [
+            (category[:rng.randint(1, 3)],) for category in rng.choices(NER_CATEGORIES, k=n_queries)
+        ]),
+        find_document_ids_by_ner_category=_measure(ner_repository.find_document_ids_by_ner_category, [
+            (category,) for category in rng.choices(NER_CATEGORIES, weights=NER_CATEGORY_WEIGHTS, k=n_queries)
+        ]),
+        find_by_ids=_measure(document_repository.find_by_ids, [
+            (rng.sample(ids, FIND_BY_IDS_SIZE),) for _ in range(n_queries)
+        ])
+    )
+    document_repository.truncate()
+    ner_repository.truncate()
+    return results
+
+
+def compare(results: dict, baseline: dict, prefix: str = "") -> List[str]:
+    """ relative change of every metric of results against the same metric of baseline
+
+    :param results:
+    :param baseline:
+    :param prefix:
+    :return: one line per metric
+    """
+    lines: List[str] = []
+    for key, value in results.items():
+        if key not in baseline or key in ("meta", "n"):
+            continue
+        if isinstance(value, dict):
+            lines.extend(compare(value, baseline[key], prefix=f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and baseline[key]:
+            lines.append(f"{prefix}{key}: {baseline[key]:.4g} -> {value:.4g} ({(value / baseline[key] - 1) * 100:+.1f}%)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="number of spans in the db for the query benchmarks")
+    parser.add_argument("--ingest-docs", type=int, default=2000, help="number of documents of the ingestion benchmark")
+    parser.add_argument("--batch-size", type=int, default=32, help="batch size of the ingestion benchmark")
+    parser.add_argument("--queries", type=int, default=100, help="number of calls of each query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", default=None, help="sqlite db path, a temporary file by default")
+    parser.add_argument("--output", default="bench.json", help="path of the json results")
+    parser.add_argument("--baseline", default=None, help="json results of a previous run to compare with")
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="ling_508_bench_"), "bench.db")
+    results = dict(
+        meta=dict(
+            started_at=datetime.now().isoformat(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            sqlalchemy=sqlalchemy.__version__,
+            seed=args.seed,
+            ingest_docs=args.ingest_docs,
+            batch_size=args.batch_size,
+            queries=args.queries
+        ),
+        ingestion=bench_ingestion(database, n_docs=args.ingest_docs, batch_size=args.batch_size, seed=args.seed),
+        queries={}
+    )
+    for n_spans in args.sizes:
+        results["queries"][str(n_spans)] = bench_queries(database, n_spans=n_spans, n_queries=args.queries,
+                                                         seed=args.seed)
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            print("\n".join(compare(results, json.load(baseline))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import random
+import zlib
+from datetime import datetime
+from typing import Iterator, List, Optional, Text, Tuple
+
+from models.models import Document, NERSpan, RawDocument
+from repositories.repositories import WebDocumentRepositoryImpl, SQLDocumentRepositoryImpl, SQLNERSpanRepository, \
+    SQLIngestCheckpointRepository
+from services.services import ScrapyScrapperService, StanzaNERExtractionService
+
+# categories of the ontonotes model used by stanza for english, the first ones are the most frequent in news
+NER_CATEGORIES = [
+    "PERSON", "GPE", "ORG", "DATE", "CARDINAL", "NORP", "MONEY", "PERCENT", "ORDINAL", "LOC", "TIME", "WORK_OF_ART",
+    "FAC", "EVENT", "QUANTITY", "PRODUCT", "LAW", "LANGUAGE"
+]
+# zipf like weights, so that some categories match a large part of the documents and others only a few
+NER_CATEGORY_WEIGHTS = [1 / rank for rank in range(1, len(NER_CATEGORIES) + 1)]
+
+WORDS = [
+    "the", "of", "and", "to", "in", "said", "for", "on", "that", "with", "was", "is", "by", "at", "from", "his", "has",
+    "have", "will", "after", "government", "people", "year", "state", "officials", "week", "police", "report", "city",
+    "country", "new", "former", "president", "company", "percent", "million", "court", "election", "told", "news"
+]
+NAMES = [
+    "Obama", "Trump", "Clinton", "Paris", "London", "Washington", "Google", "Apple", "Reuters", "Congress", "Europe",
+    "Merkel", "Texas", "China", "Twitter", "Senate", "Monday", "Friday", "Syria", "Boeing"
+]
+
+
+def synthetic_texts(n_docs: int, seed: int = 0, words_per_doc: int = 80, html: bool = True) -> List[Text]:
+    """ deterministic news like documents. About one word out of eight is a capitalized name, which StubNER tags as a
+    named entity, and each document is unique so that none of them is dropped as an already stored duplicate.
+
+    :param n_docs:
+    :param seed:
+    :param words_per_doc:
+    :param html: if True, wrap sentences into html tags like the raw documents of the web
+    :return:
+    """
+    rng = random.Random(seed)
+    texts: List[Text] = []
+    for i in range(n_docs):
+        words = [rng.choice(NAMES) if rng.random() < 0.125 else rng.choice(WORDS) for _ in range(words_per_doc)]
+        sentences = [" ".join(words[start:start + 16]) + "." for start in range(0, len(words), 16)]
+        sentences[0] = f"Document {i}: {sentences[0]}"
+        if html:
+            texts.append("".join(f"<p>{sentence}</p>" for sentence in sentences))
+        else:
+            texts.append(" ".join(sentences))
+    return texts
+
+
+def synthetic_spans(documents: List[Document], spans_per_doc: int, seed: int = 0) -> Iterator[NERSpan]:
+    """ random spans over stored documents, with categories drawn from NER_CATEGORY_WEIGHTS
+
+    :param documents: stored documents, with their ids
+    :param spans_per_doc:
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+    for document in documents:
+        categories = rng.choices(NER_CATEGORIES, weights=NER_CATEGORY_WEIGHTS, k=spans_per_doc)
+        for category in categories:
+            start_span = rng.randrange(max(1, len(document.text) - 10))
+            yield NERSpan.of(
+                start_span=start_span,
+                end_span=start_span + rng.randint(3, 10),
+                document_id=document.id,
+                ner_tag=f"S-{category}"
+            )
+
+
+class SyntheticWebDocumentRepository(WebDocumentRepositoryImpl):
+    """ WebDocumentRepositoryImpl over in-memory texts instead of the multi_news dataset
+    """
+
+    def __init__(self, texts: List[Text]):
+        super(SyntheticWebDocumentRepository, self).__init__()
+        self.texts = texts
+
+    def retrieve_iter(self, date: datetime, offset: int = 0, limit: Optional[int] = None,
+                      chunk_size: int = 1000) -> Iterator[RawDocument]:
+        end = len(self.texts) if limit is None else min(len(self.texts), offset + limit)
+        for text in self.texts[offset:end]:
+            yield RawDocument(date=date, text=text)
+
+
+class SyntheticScrapperService(ScrapyScrapperService):
+    """ ScrapyScrapperService reading synthetic texts and storing into a sqlite db
+    """
+
+    def __init__(self, texts: List[Text], database: str):
+        self.web_document_repository = SyntheticWebDocumentRepository(texts)
+        self.db_document_repository = SQLDocumentRepositoryImpl.instance(host="", database=database, engine="sqlite")
+        self.checkpoint_repository = SQLIngestCheckpointRepository.instance(host="", database=database,
+                                                                           engine="sqlite")
+
+
+class StubNERExtractionService(StanzaNERExtractionService):
+    """ stands in for the stanza pipeline, so that benchmarks measure the rest of the ingestion without a model. Every
+    capitalized word is a named entity, with a category derived from the word itself.
+    """
+
+    def __init__(self, database: str):
+        super(StubNERExtractionService, self).__init__(persistent=False)
+        self.ne_repo = SQLNERSpanRepository.instance(host="", database=database, engine="sqlite")
+
+    def extract(self, doc: Document) -> List[Tuple[int, int, Text]]:
+        results: List[Tuple[int, int, Text]] = []
+        start = 0
+        for word in doc.text.split(" "):
+            if word[:1].isupper():
+                category = NER_CATEGORIES[zlib.crc32(word.encode()) % len(NER_CATEGORIES)]
+                results.append((start, start + len(word), f"S-{category}"))
+            start += len(word) + 1
+        return results
+
+    def extract_batch(self, docs: List[Document]) -> List[List[Tuple[int, int, Text]]]:
+        return [self.extract(doc) for doc in docs]
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.bench import bench_ingestion, bench_queries, compare
+from benchmarks.synthetic import StubNERExtractionService, synthetic_texts
+from models.models import Document
+
+
+class BenchTest(unittest.TestCase):
+    database = os.path.join(tempfile.mkdtemp(prefix="ling_508_bench_test_"), "bench.db")
+
+    def test_synthetic_texts(self):
+        self.assertEqual(synthetic_texts(5, seed=1), synthetic_texts(5, seed=1))
+        self.assertEqual(5, len(set(synthetic_texts(5, seed=1, html=False))))
+
+    def test_stub_ner(self):
+        text = "the Obama said"
+        spans = StubNERExtractionService(database=self.database).extract(Document(date=None, text=text))
+        self.assertEqual(1, len(spans))
+        self.assertEqual("Obama", text[spans[0][0]:spans[0][1]])
+
+    def test_bench_ingestion(self):
+        results = bench_ingestion(self.database, n_docs=20, batch_size=8, seed=0)
+        self.assertIn("extract_docs_per_sec", results)
+        self.assertGreater(results["process_docs_per_sec"], 0)
+
+    def test_bench_queries(self):
+        results = bench_queries(self.database, n_spans=200, n_queries=5, seed=0)
+        self.assertEqual(5, results["find_by_ids"]["n"])
+        self.assertGreater(results["inserts"]["spans_per_sec"], 0)
+        self.assertEqual(["find_by_ids.p50_ms: 2 -> 1 (-50.0%)"], compare(
+            dict(find_by_ids=dict(n=5, p50_ms=1)), dict(find_by_ids=dict(n=5, p50_ms=2))
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
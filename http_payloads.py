@@ -0,0 +1,64 @@
+""" request and response payloads shared by the Flask app (app.py) and the ASGI app (asgi.py)
+"""
+from models.models import DocumentSnippet
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+MAX_SNIPPET_SIZE = 2000
+
+
+def category_stats_data(stats):
+    return {"ner_category": stats.ner_category, "document_count": stats.document_count,
+            "mention_count": stats.mention_count}
+
+
+class InvalidPageArgs(ValueError):
+    """ a limit, after or snippet_size that is not an integer, or that is out of range
+    """
+    pass
+
+
+def _int_arg(request_payload, name, minimum):
+    value = request_payload.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise InvalidPageArgs(f"{name} must be an integer, got {value!r}")
+    try:
+        value = int(value)
+    except ValueError:
+        raise InvalidPageArgs(f"{name} must be an integer, got {value!r}")
+    if value < minimum:
+        raise InvalidPageArgs(f"{name} must be at least {minimum}, got {value}")
+    return value
+
+
+def is_page_request(request_payload) -> bool:
+    """ whether a search payload asks for one page of documents rather than all of them, that is whether it has any of
+    limit, after or snippet_size
+    """
+    return any(name in request_payload for name in ("limit", "after", "snippet_size"))
+
+
+def page_args(request_payload):
+    """ limit, after and snippet_size of a paginated search payload, bounded by MAX_PAGE_SIZE and MAX_SNIPPET_SIZE.
+    Raises InvalidPageArgs, to be answered with a 400 response, if limit or snippet_size is not a positive integer or
+    after is not a non negative integer.
+    """
+    limit = _int_arg(request_payload, "limit", 1)
+    after = _int_arg(request_payload, "after", 0)
+    snippet_size = _int_arg(request_payload, "snippet_size", 1)
+    limit = DEFAULT_PAGE_SIZE if limit is None else min(limit, MAX_PAGE_SIZE)
+    if snippet_size is not None:
+        snippet_size = min(snippet_size, MAX_SNIPPET_SIZE)
+    return limit, after, snippet_size
+
+
+def documents_data(documents):
+    data = []
+    for doc in documents:
+        if isinstance(doc, DocumentSnippet):
+            data.append({"id": doc.id, "offset": doc.offset, "text": doc.text})
+        else:
+            data.append({"id": doc.id, "text": doc.text})
+    return data
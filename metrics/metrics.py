@@ -0,0 +1,129 @@
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Text, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+INGEST_STAGE_SECONDS = Histogram(
+    "ling_508_ingest_stage_seconds",
+    "Time spent in each ingestion stage, per batch of documents",
+    ["stage"]
+)
+INGEST_STAGE_DOCUMENTS = Counter(
+    "ling_508_ingest_stage_documents",
+    "Number of documents that went through each ingestion stage",
+    ["stage"]
+)
+REPOSITORY_QUERY_SECONDS = Histogram(
+    "ling_508_repository_query_seconds",
+    "Latency of each repository query",
+    ["repository", "query"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "ling_508_http_request_seconds",
+    "Latency of each http route, until the response headers are sent, or the whole body if it is streamed",
+    ["route", "method", "status"]
+)
+HTTP_SERIALIZATION_SECONDS = Histogram(
+    "ling_508_http_serialization_seconds",
+    "Time spent serializing the response body of each http route",
+    ["route"]
+)
+NER_CACHE_LOOKUPS = Counter(
+    "ling_508_ner_cache_lookups",
+    "Lookups of texts in the NER result cache, by result: hit or miss",
+    ["result"]
+)
+DOCUMENT_CACHE_LOOKUPS = Counter(
+    "ling_508_document_cache_lookups",
+    "Lookups of documents by id in the in-memory document cache, by result: hit or miss",
+    ["result"]
+)
+
+
+def timed_query(func: Callable) -> Callable:
+    """ decorator of repository methods, that records their latency into REPOSITORY_QUERY_SECONDS, labelled by the
+    class and the name of the method. Coroutine functions are supported too.
+
+    :param func:
+    :return:
+    """
+    repository, _, query = func.__qualname__.rpartition(".")
+    histogram = REPOSITORY_QUERY_SECONDS.labels(repository=repository, query=query)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with histogram.time():
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with histogram.time():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def metrics_response() -> Tuple[bytes, str]:
+    """ body and content type of the /metrics endpoint, in prometheus text format. When PROMETHEUS_MULTIPROC_DIR is set,
+    as it must be when several worker processes serve the app, for example under gunicorn, the metrics of all the
+    workers are merged from the files they write there, otherwise they are the metrics of this process only.
+
+    :return:
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class StageTimer:
+    """ time and number of documents of each ingestion stage. A timer is filled for each batch, wherever the batch is
+    processed, and then added to the timer of the whole run, which records it into INGEST_STAGE_SECONDS and
+    INGEST_STAGE_DOCUMENTS.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[Text, float] = {}
+        self.documents: Dict[Text, int] = {}
+
+    @contextmanager
+    def stage(self, stage: Text, n_documents: int):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+            self.documents[stage] = self.documents.get(stage, 0) + n_documents
+
+    def add(self, batch_timer: "StageTimer") -> None:
+        """ add the stages of a batch to this timer, and record them into the prometheus metrics
+
+        :param batch_timer:
+        :return:
+        """
+        for stage, seconds in batch_timer.seconds.items():
+            n_documents = batch_timer.documents[stage]
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.documents[stage] = self.documents.get(stage, 0) + n_documents
+            INGEST_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+            INGEST_STAGE_DOCUMENTS.labels(stage=stage).inc(n_documents)
+
+    def summary(self) -> Text:
+        """ one line per stage, in the order the stages first ran
+
+        :return:
+        """
+        lines = [f"{'stage':<24}{'documents':>12}{'seconds':>12}{'docs/sec':>12}"]
+        for stage, seconds in self.seconds.items():
+            n_documents = self.documents[stage]
+            docs_per_sec = n_documents / seconds if seconds > 0 else 0.0
+            lines.append(f"{stage:<24}{n_documents:>12}{seconds:>12.3f}{docs_per_sec:>12.1f}")
+        return "\n".join(lines)
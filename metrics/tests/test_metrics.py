@@ -0,0 +1,75 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from metrics.metrics import StageTimer, metrics_response, timed_query
+
+
+class Repository:
+
+    @timed_query
+    def find(self, value):
+        return value
+
+    @timed_query
+    async def find_async(self, value):
+        return value
+
+
+def query_count(query: str) -> float:
+    return REGISTRY.get_sample_value(
+        "ling_508_repository_query_seconds_count", dict(repository="Repository", query=query)
+    )
+
+
+class TimedQueryTest(unittest.TestCase):
+
+    def test_timed_query(self):
+        count = query_count("find")
+        self.assertEqual(1, Repository().find(1))
+        self.assertEqual(count + 1, query_count("find"))
+
+    def test_timed_async_query(self):
+        count = query_count("find_async")
+        self.assertEqual(1, asyncio.run(Repository().find_async(1)))
+        self.assertEqual(count + 1, query_count("find_async"))
+
+
+class StageTimerTest(unittest.TestCase):
+
+    def test_add(self):
+        documents = REGISTRY.get_sample_value("ling_508_ingest_stage_documents_total", dict(stage="test_stage")) or 0
+        run_timer = StageTimer()
+        for _ in range(2):
+            batch_timer = StageTimer()
+            with batch_timer.stage("test_stage", 3):
+                pass
+            run_timer.add(batch_timer)
+
+        self.assertEqual({"test_stage": 6}, run_timer.documents)
+        self.assertEqual(documents + 6,
+                         REGISTRY.get_sample_value("ling_508_ingest_stage_documents_total", dict(stage="test_stage")))
+        self.assertEqual(2, len(run_timer.summary().splitlines()))
+
+
+class MetricsResponseTest(unittest.TestCase):
+
+    def test_process_metrics(self):
+        body, _ = metrics_response()
+        self.assertIn(b"ling_508_repository_query_seconds", body)
+
+    def test_multiprocess_metrics(self):
+        """ with PROMETHEUS_MULTIPROC_DIR, metrics are read from the files of the workers, there are none here
+        """
+        with tempfile.TemporaryDirectory() as multiproc_dir:
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": multiproc_dir}):
+                body, _ = metrics_response()
+        self.assertEqual(b"", body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,11 @@
+import hashlib
+import zlib
+from array import array
 from datetime import datetime
-from typing import Text
+from typing import Dict, Iterable, Iterator, List, Optional, Text, Tuple
+
+# maximum length of the surface text of an entity mention, and of its search key
+ENTITY_TEXT_SIZE = 255
 
 
 class Document:
@@ -17,6 +23,14 @@ class Document:
         self.date = date
         self.text = text
 
+    @property
+    def content_hash(self) -> str:
+        """ sha256 hex digest of the text, documents with the same text have the same content_hash
+
+        :return:
+        """
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
     def __str__(self) -> str:
         return f"Document(id={self.id}, date={self.date}, text={self.text})"
 
@@ -32,33 +46,253 @@ class RawDocument(Document):
         super(RawDocument, self).__init__(date, text)
 
 
+class CompressedDocument(Document):
+    """ Document read from compressed storage. Its text is only decompressed when it is first accessed, so documents
+    whose text is never used cost no decompression.
+    """
+    # zlib level of compress, a good tradeoff between ratio and speed for news articles
+    COMPRESSION_LEVEL = 6
+
+    @staticmethod
+    def compress(text: Text) -> bytes:
+        return zlib.compress(text.encode("utf-8"), CompressedDocument.COMPRESSION_LEVEL)
+
+    @staticmethod
+    def decompress(compressed_text: bytes) -> Text:
+        return zlib.decompress(compressed_text).decode("utf-8")
+
+    def __init__(self, date: datetime, compressed_text: bytes, id: int = None):
+        super(CompressedDocument, self).__init__(date, None, id=id)
+        self.compressed_text = compressed_text
+
+    @property
+    def text(self) -> Text:
+        if self.compressed_text is not None:
+            self._text = CompressedDocument.decompress(self.compressed_text)
+            self.compressed_text = None
+        return self._text
+
+    @text.setter
+    def text(self, text: Text) -> None:
+        self._text = text
+        self.compressed_text = None
+
+
+class DocumentSnippet(Document):
+    """ A bounded part of a document text, offset is the position of the snippet in the full text
+    """
+
+    def __init__(self, date: datetime, text: Text, offset: int, id: int = None):
+        super(DocumentSnippet, self).__init__(date, text, id=id)
+        self.offset = offset
+
+    @staticmethod
+    def of(doc: Document, position: int, size: int):
+        """ cut a snippet of at most size characters out of doc, centered around position when possible
+
+        :param doc:
+        :param position:
+        :param size:
+        :return:
+        """
+        offset = max(0, min(position - size // 2, len(doc.text) - size))
+        return DocumentSnippet(date=doc.date, text=doc.text[offset:offset + size], offset=offset, id=doc.id)
+
+    def __str__(self) -> str:
+        return f"DocumentSnippet(id={self.id}, date={self.date}, offset={self.offset}, text={self.text})"
+
+
 class NERSpan:
     """ Named entity span in a document. It describes which token, denoted by start_span and end_span, will be tagged.
     ner_tag is the full tag of a token, if it is using BIO/IOB format: B-PERSON, ner_category is the actual named entity
-    tag, without any prefixes, for example PERSON
+    tag, without any prefixes, for example PERSON.
+
+    A span can also be a whole entity mention, merged from the tags of its tokens by merge_mentions. Its ner_tag is
+    then its ner_category, and entity_text is its surface text, for example Barack Obama. entity_key is the normalized
+    entity_text that mentions are searched by.
     """
+    __slots__ = ("id", "start_span", "end_span", "document_id", "ner_tag", "ner_category", "entity_text", "entity_key")
 
     @staticmethod
-    def of(start_span: int, end_span: int, document_id: int, ner_tag: str):
+    def of(start_span: int, end_span: int, document_id: int, ner_tag: str, entity_text: Optional[str] = None):
         ner_category = ner_tag.split("-")[-1]
         return NERSpan(
             start_span=start_span,
             end_span=end_span,
             document_id=document_id,
             ner_tag=ner_tag,
-            ner_category=ner_category
+            ner_category=ner_category,
+            entity_text=entity_text
         )
 
-    def __init__(self, start_span: int, end_span: int, document_id: int, ner_tag: str, ner_category: str, id: int = -1):
+    @staticmethod
+    def entity_key_of(entity_text: Optional[str]) -> Optional[str]:
+        """ search key of an entity text: case folded, with whitespace runs collapsed into a single space, so that
+        "Barack  Obama" and "barack obama" are the same entity
+
+        :param entity_text:
+        :return:
+        """
+        if entity_text is None:
+            return None
+        return " ".join(entity_text.split()).casefold()[:ENTITY_TEXT_SIZE]
+
+    @staticmethod
+    def merge_mentions(raw_ne_spans: Iterable[Tuple[int, int, Text]]) -> List[Tuple[int, int, Text]]:
+        """ merge the spans of the tokens of each entity mention into a single span. Tokens are tagged in BIOES format:
+        a mention is either one S- token, or a B- token, I- tokens and an E- token of the same category. BIO tags are
+        merged too. A token that does not continue the open mention starts a new one.
+
+        :param raw_ne_spans: (start_span, end_span, ner_tag) tuples of one document, in text order, as returned by NER
+            extraction
+        :return: (start_span, end_span, ner_category) tuple of each mention
+        """
+        mentions: List[Tuple[int, int, Text]] = []
+        mention = None
+        for start_span, end_span, ner_tag in raw_ne_spans:
+            prefix, _, ner_category = ner_tag.rpartition("-")
+            if prefix in ("I", "E") and mention is not None and mention[2] == ner_category:
+                mention = (mention[0], end_span, ner_category)
+            else:
+                if mention is not None:
+                    mentions.append(mention)
+                mention = (start_span, end_span, ner_category)
+            if prefix not in ("B", "I"):
+                mentions.append(mention)
+                mention = None
+        if mention is not None:
+            mentions.append(mention)
+        return mentions
+
+    def __init__(self, start_span: int, end_span: int, document_id: int, ner_tag: str, ner_category: str, id: int = -1,
+                 entity_text: Optional[str] = None, entity_key: Optional[str] = None):
         self.id = id
         self.start_span = start_span
         self.end_span = end_span
         self.document_id = document_id
         self.ner_tag = ner_tag
         self.ner_category = ner_category
+        self.entity_text = entity_text
+        self.entity_key = NERSpan.entity_key_of(entity_text) if entity_key is None else entity_key
 
     def __str__(self) -> str:
         return f"NERSpan(id={self.id}, start_span={self.start_span}, end_span={self.end_span}, document_id={self.document_id} , ner_tag={self.ner_tag})"
 
     def __repr__(self) -> str:
         return self.__str__()
+
+
+class NERCategoryStats:
+    """ Number of distinct documents that mention a ner category, and number of its mentions in all documents
+    """
+    __slots__ = ("ner_category", "document_count", "mention_count")
+
+    def __init__(self, ner_category: str, document_count: int = 0, mention_count: int = 0):
+        self.ner_category = ner_category
+        self.document_count = document_count
+        self.mention_count = mention_count
+
+    def __str__(self) -> str:
+        return f"NERCategoryStats(ner_category={self.ner_category}, document_count={self.document_count}, " \
+               f"mention_count={self.mention_count})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class NERSpanBatch:
+    """ Many named entity spans, stored column by column in arrays instead of one NERSpan object per span. ner_tags are
+    stored once in ner_tags, and each span refers to its tag by its index in ner_tags, its tag code.
+    """
+    __slots__ = ("ids", "document_ids", "start_spans", "end_spans", "tag_codes", "ner_tags", "entity_texts",
+                 "_tag_codes_by_tag")
+
+    @staticmethod
+    def of(ner_spans: Iterable[NERSpan]) -> "NERSpanBatch":
+        batch = NERSpanBatch()
+        for ner_span in ner_spans:
+            batch.append(ner_span.document_id, ner_span.start_span, ner_span.end_span, ner_span.ner_tag, id=ner_span.id,
+                         entity_text=ner_span.entity_text)
+        return batch
+
+    def __init__(self):
+        self.ids = array("q")
+        self.document_ids = array("q")
+        self.start_spans = array("q")
+        self.end_spans = array("q")
+        self.tag_codes = array("i")
+        self.ner_tags: List[Text] = []
+        self.entity_texts: List[Optional[Text]] = []
+        self._tag_codes_by_tag: Dict[Text, int] = {}
+
+    def tag_code(self, ner_tag: Text) -> int:
+        """ code of ner_tag, ner_tag is added to ner_tags if this batch does not have it yet
+
+        :param ner_tag:
+        :return:
+        """
+        tag_code = self._tag_codes_by_tag.get(ner_tag)
+        if tag_code is None:
+            tag_code = len(self.ner_tags)
+            self.ner_tags.append(ner_tag)
+            self._tag_codes_by_tag[ner_tag] = tag_code
+        return tag_code
+
+    def append(self, document_id: int, start_span: int, end_span: int, ner_tag: Text, id: int = -1,
+               entity_text: Optional[Text] = None) -> None:
+        self.ids.append(id)
+        self.document_ids.append(document_id)
+        self.start_spans.append(start_span)
+        self.end_spans.append(end_span)
+        self.tag_codes.append(self.tag_code(ner_tag))
+        self.entity_texts.append(entity_text)
+
+    def extend(self, document_id: int, raw_ne_spans: Iterable[Tuple[int, int, Text]],
+               text: Optional[Text] = None) -> None:
+        """ append the spans extracted from one document
+
+        :param document_id:
+        :param raw_ne_spans: (start_span, end_span, ner_tag) tuples, as returned by NER extraction
+        :param text: text of the document. If set, tokens are merged into one span per entity mention, with its
+            surface text, see NERSpan.merge_mentions
+        :return:
+        """
+        if text is None:
+            for start_span, end_span, ner_tag in raw_ne_spans:
+                self.append(document_id, start_span, end_span, ner_tag)
+            return
+
+        for start_span, end_span, ner_category in NERSpan.merge_mentions(raw_ne_spans):
+            self.append(document_id, start_span, end_span, ner_category,
+                        entity_text=text[start_span:end_span][:ENTITY_TEXT_SIZE])
+
+    @property
+    def ner_categories(self) -> List[Text]:
+        """ ner category of each tag of ner_tags, so it can be looked up by tag code too
+
+        :return:
+        """
+        return [ner_tag.split("-")[-1] for ner_tag in self.ner_tags]
+
+    def __len__(self) -> int:
+        return len(self.document_ids)
+
+    def __getitem__(self, i: int) -> NERSpan:
+        ner_tag = self.ner_tags[self.tag_codes[i]]
+        return NERSpan(
+            start_span=self.start_spans[i],
+            end_span=self.end_spans[i],
+            document_id=self.document_ids[i],
+            ner_tag=ner_tag,
+            ner_category=ner_tag.split("-")[-1],
+            id=self.ids[i],
+            entity_text=self.entity_texts[i]
+        )
+
+    def __iter__(self) -> Iterator[NERSpan]:
+        """ materialize the spans one at a time, only for callers that need NERSpan objects
+
+        :return:
+        """
+        for i in range(len(self)):
+            yield self[i]
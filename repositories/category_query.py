@@ -0,0 +1,188 @@
+import re
+from abc import ABC, abstractmethod
+from typing import List, Set, Text
+
+from sqlalchemy import and_, case, func, not_, or_
+from sqlalchemy.sql import ColumnElement
+
+# parentheses, or a run of anything else that is not whitespace
+TOKEN_PATTERN = re.compile(r"[()]|[^\s()]+")
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+class InvalidCategoryQuery(ValueError):
+    """ a category query that cannot be parsed, or that would match documents without any of its categories
+    """
+    pass
+
+
+class CategoryQuery(ABC):
+    """ Boolean expression over ner categories, that a document matches depending on the categories it mentions.
+    Parse one with parse_category_query.
+    """
+
+    @abstractmethod
+    def categories(self) -> Set[str]:
+        """ every category of the expression
+
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def matches(self, ner_categories: Set[str]) -> bool:
+        """ whether a document that mentions exactly ner_categories matches this expression
+
+        :param ner_categories:
+        :return:
+        """
+        pass
+
+
+class CategoryTerm(CategoryQuery):
+    def __init__(self, ner_category: str):
+        self.ner_category = ner_category
+
+    def categories(self) -> Set[str]:
+        return {self.ner_category}
+
+    def matches(self, ner_categories: Set[str]) -> bool:
+        return self.ner_category in ner_categories
+
+    def __str__(self) -> str:
+        return self.ner_category
+
+
+class NotQuery(CategoryQuery):
+    def __init__(self, operand: CategoryQuery):
+        self.operand = operand
+
+    def categories(self) -> Set[str]:
+        return self.operand.categories()
+
+    def matches(self, ner_categories: Set[str]) -> bool:
+        return not self.operand.matches(ner_categories)
+
+    def __str__(self) -> str:
+        return f"NOT {self.operand}"
+
+
+class AndQuery(CategoryQuery):
+    def __init__(self, operands: List[CategoryQuery]):
+        self.operands = operands
+
+    def categories(self) -> Set[str]:
+        return set().union(*(operand.categories() for operand in self.operands))
+
+    def matches(self, ner_categories: Set[str]) -> bool:
+        return all(operand.matches(ner_categories) for operand in self.operands)
+
+    def __str__(self) -> str:
+        return "(" + " AND ".join(str(operand) for operand in self.operands) + ")"
+
+
+class OrQuery(CategoryQuery):
+    def __init__(self, operands: List[CategoryQuery]):
+        self.operands = operands
+
+    def categories(self) -> Set[str]:
+        return set().union(*(operand.categories() for operand in self.operands))
+
+    def matches(self, ner_categories: Set[str]) -> bool:
+        return any(operand.matches(ner_categories) for operand in self.operands)
+
+    def __str__(self) -> str:
+        return "(" + " OR ".join(str(operand) for operand in self.operands) + ")"
+
+
+def category_query_having(query: CategoryQuery, ner_category: ColumnElement) -> ColumnElement:
+    """ HAVING condition of query, over spans grouped by document_id: a category is mentioned by a document if the
+    number of its spans in the group is not 0
+
+    :param query:
+    :param ner_category: ner_category column of the grouped spans
+    :return:
+    """
+    if isinstance(query, CategoryTerm):
+        return func.sum(case((ner_category == query.ner_category, 1), else_=0)) > 0
+    if isinstance(query, NotQuery):
+        return not_(category_query_having(query.operand, ner_category))
+    if isinstance(query, AndQuery):
+        return and_(*(category_query_having(operand, ner_category) for operand in query.operands))
+    if isinstance(query, OrQuery):
+        return or_(*(category_query_having(operand, ner_category) for operand in query.operands))
+    raise InvalidCategoryQuery(f"unknown category query {query}")
+
+
+def parse_category_query(text: Text) -> CategoryQuery:
+    """ parse a boolean expression over ner categories, for example `PERSON AND (LAW OR ORG) AND NOT GPE`. NOT binds
+    tighter than AND, which binds tighter than OR, and operators are case insensitive. A single category is a
+    CategoryTerm.
+
+    Only documents that mention at least one of the categories are ever searched, so expressions that would match a
+    document without any of them, like `NOT LAW`, are rejected.
+
+    :param text:
+    :return:
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    if len(tokens) == 0:
+        raise InvalidCategoryQuery("empty category query")
+
+    parser = _CategoryQueryParser(tokens)
+    query = parser.parse_or()
+    if parser.position < len(tokens):
+        raise InvalidCategoryQuery(f"unexpected {tokens[parser.position]!r} in category query {text!r}")
+    if query.matches(set()):
+        raise InvalidCategoryQuery(f"category query {text!r} must require at least one category, for example "
+                                   f"PERSON AND NOT LAW instead of NOT LAW")
+    return query
+
+
+class _CategoryQueryParser:
+    """ recursive descent parser of parse_category_query
+    """
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> str:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ""
+
+    def accept(self, operator: str) -> bool:
+        if self.peek().upper() == operator:
+            self.position += 1
+            return True
+        return False
+
+    def parse_or(self) -> CategoryQuery:
+        operands = [self.parse_and()]
+        while self.accept("OR"):
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else OrQuery(operands)
+
+    def parse_and(self) -> CategoryQuery:
+        operands = [self.parse_not()]
+        while self.accept("AND"):
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else AndQuery(operands)
+
+    def parse_not(self) -> CategoryQuery:
+        if self.accept("NOT"):
+            return NotQuery(self.parse_not())
+        return self.parse_term()
+
+    def parse_term(self) -> CategoryQuery:
+        token = self.peek()
+        if token == "":
+            raise InvalidCategoryQuery("category query ends with an operator")
+        self.position += 1
+        if token == "(":
+            query = self.parse_or()
+            if not self.accept(")"):
+                raise InvalidCategoryQuery("missing ) in category query")
+            return query
+        if token == ")" or token.upper() in OPERATORS:
+            raise InvalidCategoryQuery(f"expected a category instead of {token!r} in category query")
+        return CategoryTerm(token)
@@ -0,0 +1,320 @@
+import heapq
+import itertools
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from repositories.category_query import AndQuery, CategoryQuery, CategoryTerm, NotQuery, OrQuery
+from repositories.repositories import NERSpanRepository
+
+
+def _contains(posting: Sequence[int], document_id: int, lo: int) -> Tuple[bool, int]:
+    """ whether the sorted posting contains document_id, searching from lo with a galloping search, so that probing
+    increasing ids costs the log of the distance between them rather than the log of the posting length
+
+    :param posting:
+    :param document_id:
+    :param lo: position to search from, every id before it is lower than document_id
+    :return: whether document_id was found, and the position to search the next higher id from
+    """
+    step = 1
+    hi = lo
+    while hi < len(posting) and posting[hi] < document_id:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    position = bisect_left(posting, document_id, lo, min(hi + 1, len(posting)))
+    return position < len(posting) and posting[position] == document_id, position
+
+
+def _intersect(postings: List[Sequence[int]]) -> List[int]:
+    """ ids that are in every one of the sorted postings, each id of the shortest posting is probed in the others
+
+    :param postings:
+    :return:
+    """
+    postings = sorted(postings, key=len)
+    positions = [0] * len(postings)
+    results = []
+    for document_id in postings[0]:
+        for i in range(1, len(postings)):
+            found, positions[i] = _contains(postings[i], document_id, positions[i])
+            if not found:
+                break
+        else:
+            results.append(document_id)
+    return results
+
+
+def _difference(posting: Sequence[int], excluded_postings: List[Sequence[int]]) -> List[int]:
+    """ ids of the sorted posting that are in none of the sorted excluded_postings
+
+    :param posting:
+    :param excluded_postings:
+    :return:
+    """
+    positions = [0] * len(excluded_postings)
+    results = []
+    for document_id in posting:
+        excluded = False
+        for i, excluded_posting in enumerate(excluded_postings):
+            found, positions[i] = _contains(excluded_posting, document_id, positions[i])
+            if found:
+                excluded = True
+        if not excluded:
+            results.append(document_id)
+    return results
+
+
+def _union(postings: List[Sequence[int]]) -> List[int]:
+    results = []
+    for document_id in heapq.merge(*postings):
+        if len(results) == 0 or results[-1] != document_id:
+            results.append(document_id)
+    return results
+
+
+class RefreshableIndex(ABC):
+    """ In-memory index that is loaded from a repository and has to be refreshed to see newly stored data.
+    """
+
+    def __init__(self, refresh_interval: float = 60.0):
+        """
+
+        :param refresh_interval: minimum number of seconds between two refreshes done by refresh_if_stale
+        """
+        self.refresh_interval = refresh_interval
+        self.last_refresh_time: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """ load the data stored after the last refresh into the index.
+
+        :return: number of records read
+        """
+        with self._refresh_lock:
+            n_records = self._refresh()
+            self.last_refresh_time = time.monotonic()
+            return n_records
+
+    def refresh_if_stale(self) -> None:
+        """ refresh the index if the last refresh is older than refresh_interval. When another thread is already
+        refreshing, the index is served as it is.
+
+        :return:
+        """
+        if self.last_refresh_time is not None \
+                and time.monotonic() - self.last_refresh_time < self.refresh_interval:
+            return
+
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._refresh()
+            self.last_refresh_time = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    @abstractmethod
+    def _refresh(self) -> int:
+        pass
+
+
+class NERCategoryIndex(RefreshableIndex):
+    """ In-memory inverted index from a ner category to the sorted ids of the documents that mention it. Each posting
+    list is a compact array of document ids. The index is loaded from a NERSpanRepository, and refreshed incrementally
+    by reading the spans whose id is higher than the highest span id seen so far, minus refresh_lookback.
+
+    Span ids are allocated when spans are inserted, not when they are committed, so a transaction can commit spans
+    below ids that an earlier refresh already read. Reading again the last refresh_lookback ids catches them, spans
+    that were already read are skipped by id.
+    """
+
+    def __init__(self, ner_repository: NERSpanRepository, refresh_interval: float = 60.0, chunk_size: int = 100000,
+                 refresh_lookback: int = 10000):
+        """
+
+        :param ner_repository:
+        :param refresh_interval:
+        :param chunk_size: number of spans read from the repository per query
+        :param refresh_lookback: number of span ids below the highest one seen that are read again by each refresh,
+            spans committed further below it are only seen by a new index
+        """
+        super(NERCategoryIndex, self).__init__(refresh_interval=refresh_interval)
+        self.ner_repository = ner_repository
+        self.chunk_size = chunk_size
+        self.refresh_lookback = refresh_lookback
+        self.postings: Dict[str, array] = {}
+        self.last_span_id = 0
+        # ids of the spans read so far that are within refresh_lookback of last_span_id
+        self.recent_span_ids: Set[int] = set()
+
+    def _refresh(self) -> int:
+        new_postings: Dict[str, Set[int]] = defaultdict(set)
+        new_span_ids: Set[int] = set()
+        after_id = max(0, self.last_span_id - self.refresh_lookback)
+        while True:
+            rows = self.ner_repository.find_ner_category_postings(after_id=after_id, limit=self.chunk_size)
+            for span_id, ner_category, document_id in rows:
+                if span_id in self.recent_span_ids:
+                    continue
+                new_span_ids.add(span_id)
+                new_postings[ner_category].add(document_id)
+            if len(rows) > 0:
+                after_id = rows[-1][0]
+            if len(rows) < self.chunk_size:
+                break
+
+        # posting lists are replaced, never modified in place, so readers always see a complete list
+        for ner_category, document_ids in new_postings.items():
+            self.postings[ner_category] = self._merge(self.postings.get(ner_category), document_ids)
+        last_span_id = max(self.last_span_id, after_id)
+        self.recent_span_ids = {
+            span_id for span_id in itertools.chain(self.recent_span_ids, new_span_ids)
+            if span_id > last_span_id - self.refresh_lookback
+        }
+        self.last_span_id = last_span_id
+
+        return len(new_span_ids)
+
+    @staticmethod
+    def _merge(posting: Optional[array], document_ids: Set[int]) -> array:
+        new_document_ids = sorted(document_ids)
+        if posting is None:
+            return array("q", new_document_ids)
+
+        # a document that is already in the posting is not added twice
+        new_document_ids = [
+            document_id for document_id in new_document_ids if not _contains(posting, document_id, 0)[0]
+        ]
+        if len(new_document_ids) == 0:
+            return posting
+
+        if len(posting) == 0 or new_document_ids[0] > posting[-1]:
+            # the common case, new spans belong to newly ingested documents
+            merged = array("q", posting)
+            merged.extend(new_document_ids)
+            return merged
+
+        return array("q", sorted(set(posting).union(new_document_ids)))
+
+    def find_document_ids(self, ner_category: str) -> List[int]:
+        """ retrieve the ids of documents that mention ner_category, in ascending order.
+
+        :param ner_category:
+        :return:
+        """
+        posting = self.postings.get(ner_category)
+        if posting is None:
+            return []
+        return posting.tolist()
+
+    def find_document_ids_page(self, ner_category: str, after: Optional[int] = None, limit: int = 100) -> List[int]:
+        """ retrieve at most limit ids of documents that mention ner_category and whose id is higher than after.
+
+        :param ner_category:
+        :param after: cursor, last document id of the previous page, None for the first page
+        :param limit:
+        :return:
+        """
+        posting = self.postings.get(ner_category)
+        if posting is None:
+            return []
+        start = 0 if after is None else bisect_right(posting, after)
+        return posting[start:start + limit].tolist()
+
+    def find_document_ids_by_query(self, query: CategoryQuery, after: Optional[int] = None,
+                                   limit: Optional[int] = None) -> List[int]:
+        """ retrieve the ids of documents that match query, in ascending order, by merging the posting lists of its
+        categories. A conjunction costs about the length of its shortest posting list.
+
+        :param query: a query that does not match documents without any of its categories, see parse_category_query
+        :param after: cursor, last document id of the previous page, None for the first page
+        :param limit: None for every matching document
+        :return:
+        """
+        document_ids, complemented = self._evaluate(query)
+        if complemented:
+            raise ValueError(f"category query {query} matches documents without any of its categories")
+
+        start = 0 if after is None else bisect_right(document_ids, after)
+        end = len(document_ids) if limit is None else start + limit
+        return list(document_ids[start:end])
+
+    def _evaluate(self, query: CategoryQuery) -> Tuple[Sequence[int], bool]:
+        """ sorted document ids of query, or of its complement, so that NOT never has to enumerate every document
+
+        :param query:
+        :return: the document ids, and True if query matches every document but these ones
+        """
+        if isinstance(query, CategoryTerm):
+            return self.postings.get(query.ner_category, ()), False
+        if isinstance(query, NotQuery):
+            document_ids, complemented = self._evaluate(query.operand)
+            return document_ids, not complemented
+
+        evaluated = [self._evaluate(operand) for operand in query.operands]
+        included = [document_ids for document_ids, complemented in evaluated if not complemented]
+        excluded = [document_ids for document_ids, complemented in evaluated if complemented]
+        if isinstance(query, AndQuery):
+            if len(included) == 0:
+                # NOT a AND NOT b is NOT (a OR b)
+                return _union(excluded), True
+            return _difference(_intersect(included), excluded), False
+        if isinstance(query, OrQuery):
+            if len(excluded) == 0:
+                return _union(included), False
+            # a OR NOT b is NOT (b AND NOT a)
+            return _difference(_intersect(excluded), included), True
+        raise ValueError(f"unknown category query {query}")
+
+    def ner_categories(self) -> List[str]:
+        return sorted(self.postings.keys())
+
+
+class NERCategoryDictionary(RefreshableIndex):
+    """ In-memory dictionary of the distinct ner categories, with a precomputed map from every lower-cased substring of
+    every category to the sorted categories that contain it. Answers case-insensitive substring queries, which includes
+    prefix queries, with a single dict lookup.
+    """
+
+    def __init__(self, ner_repository: NERSpanRepository, refresh_interval: float = 60.0):
+        super(NERCategoryDictionary, self).__init__(refresh_interval=refresh_interval)
+        self.ner_repository = ner_repository
+        self.ner_categories: Tuple[str, ...] = ()
+        self.substrings: Dict[str, Tuple[str, ...]] = {}
+
+    def _refresh(self) -> int:
+        ner_categories = tuple(self.ner_repository.find_all_ner_categories())
+        if ner_categories == self.ner_categories:
+            return len(ner_categories)
+
+        substrings: Dict[str, Set[str]] = defaultdict(set)
+        for ner_category in ner_categories:
+            lowered = ner_category.lower()
+            for start in range(len(lowered)):
+                for end in range(start + 1, len(lowered) + 1):
+                    substrings[lowered[start:end]].add(ner_category)
+
+        # the map is built aside and swapped in, so readers never see a half built one
+        self.substrings = {
+            substring: tuple(sorted(matching_ner_categories))
+            for substring, matching_ner_categories in substrings.items()
+        }
+        self.ner_categories = ner_categories
+
+        return len(ner_categories)
+
+    def find_related_ner_categories(self, query: str) -> List[str]:
+        """ retrieve the sorted categories that contain query, ignoring case. An empty query matches every category.
+
+        :param query:
+        :return:
+        """
+        if not query:
+            return list(self.ner_categories)
+        return list(self.substrings.get(query.lower(), ()))
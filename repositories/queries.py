@@ -0,0 +1,167 @@
+""" select statements of the read queries of the SQL repositories, shared by SQLDocumentRepositoryImpl and
+SQLNERSpanRepository and by their async counterparts, which only differ in how the statements are executed.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Table, func, select
+from sqlalchemy.sql import Select
+
+from models.models import NERCategoryStats, NERSpan
+from repositories.category_query import CategoryQuery, category_query_having
+
+
+def select_documents(documents: Table) -> Select:
+    """ select of the columns that document_of reads
+
+    :param documents: see documents_table
+    :return:
+    """
+    return select(documents.c.id, documents.c.date, documents.c.text, documents.c.text_compressed)
+
+
+def select_documents_by_ids(documents: Table, ids: List[int]) -> Select:
+    return select_documents(documents).where(documents.c.id.in_(ids))
+
+
+def select_documents_page(documents: Table, ids: List[int], after: Optional[int] = None,
+                          limit: Optional[int] = None) -> Select:
+    """ documents of ids whose id is higher than after, in ascending id order
+
+    :param documents:
+    :param ids:
+    :param after: None for the first page
+    :param limit: None for every document
+    :return:
+    """
+    query = select_documents_by_ids(documents, ids)
+    if after is not None:
+        query = query.where(documents.c.id > after)
+    query = query.order_by(documents.c.id.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def select_related_ner_categories(ner_categories: Table, query: str, limit: int) -> Select:
+    return select(ner_categories.c.ner_category).where(
+        ner_categories.c.ner_category.ilike(f"%{query}%")
+    ).order_by(ner_categories.c.ner_category.asc()).limit(limit)
+
+
+def select_document_ids_by_ner_category(document_named_entities: Table, ner_category: str,
+                                        after: Optional[int] = None, limit: Optional[int] = None) -> Select:
+    """ distinct ids of the documents with a span of ner_category higher than after, in ascending order. Covered by the
+    (ner_category, document_id) index.
+
+    :param document_named_entities:
+    :param ner_category:
+    :param after: None for the first page
+    :param limit: None for every document
+    :return:
+    """
+    query = select(document_named_entities.c.document_id).distinct().where(
+        document_named_entities.c.ner_category == ner_category
+    )
+    if after is not None:
+        query = query.where(document_named_entities.c.document_id > after)
+    query = query.order_by(document_named_entities.c.document_id.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def select_document_ids_by_category_query(document_named_entities: Table, query: CategoryQuery,
+                                          after: Optional[int] = None, limit: Optional[int] = None) -> Select:
+    """ ids of the documents that match query: the spans of the categories of query are grouped by document, and each
+    group is kept if the categories it mentions satisfy query
+
+    :param document_named_entities:
+    :param query: a query that does not match documents without any of its categories, see parse_category_query
+    :param after: None for the first page
+    :param limit: None for every matching document
+    :return:
+    """
+    ner_category = document_named_entities.c.ner_category
+    document_id = document_named_entities.c.document_id
+    statement = select(document_id).where(ner_category.in_(sorted(query.categories())))
+    if after is not None:
+        statement = statement.where(document_id > after)
+    statement = statement.group_by(document_id).having(
+        category_query_having(query, ner_category)
+    ).order_by(document_id.asc())
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def select_first_span_starts(document_named_entities: Table, ner_category: str, document_ids: List[int]) -> Select:
+    return select(
+        document_named_entities.c.document_id,
+        func.min(document_named_entities.c.start_span)
+    ).where(
+        document_named_entities.c.ner_category == ner_category,
+        document_named_entities.c.document_id.in_(document_ids)
+    ).group_by(document_named_entities.c.document_id)
+
+
+def select_category_stats(category_document_stats: Table, ner_categories: Optional[List[str]] = None) -> Select:
+    query = select(
+        category_document_stats.c.ner_category,
+        category_document_stats.c.document_count,
+        category_document_stats.c.mention_count
+    )
+    if ner_categories is not None:
+        query = query.where(category_document_stats.c.ner_category.in_(ner_categories))
+    return query
+
+
+def category_stats_of(rows: Iterable, ner_categories: Optional[List[str]] = None) -> List[NERCategoryStats]:
+    """ stats of the rows of select_category_stats, in the order of ner_categories, or in ascending order of ner
+    category if ner_categories is None
+
+    :param rows:
+    :param ner_categories:
+    :return:
+    """
+    results: Dict[str, NERCategoryStats] = {row.ner_category: NERCategoryStats(**row) for row in rows}
+    if ner_categories is None:
+        return [results[ner_category] for ner_category in sorted(results.keys())]
+    return [results[ner_category] for ner_category in ner_categories if ner_category in results]
+
+
+def _where_entity(document_named_entities: Table, query: Select, entity_text: str,
+                  ner_category: Optional[str]) -> Select:
+    query = query.where(document_named_entities.c.entity_key == NERSpan.entity_key_of(entity_text))
+    if ner_category is not None:
+        query = query.where(document_named_entities.c.ner_category == ner_category)
+    return query
+
+
+def select_document_ids_by_entity(document_named_entities: Table, entity_text: str, ner_category: Optional[str] = None,
+                                  after: Optional[int] = None, limit: int = 100) -> Select:
+    """ distinct ids of the documents that mention entity_text, matched by its entity key, in ascending order. Covered
+    by the (entity_key, ner_category, document_id) index.
+
+    :param document_named_entities:
+    :param entity_text:
+    :param ner_category: if set, only mentions of this category
+    :param after: None for the first page
+    :param limit:
+    :return:
+    """
+    query = _where_entity(
+        document_named_entities, select(document_named_entities.c.document_id).distinct(), entity_text, ner_category
+    )
+    if after is not None:
+        query = query.where(document_named_entities.c.document_id > after)
+    return query.order_by(document_named_entities.c.document_id.asc()).limit(limit)
+
+
+def select_first_entity_starts(document_named_entities: Table, entity_text: str, ner_category: Optional[str],
+                               document_ids: List[int]) -> Select:
+    return _where_entity(document_named_entities, select(
+        document_named_entities.c.document_id,
+        func.min(document_named_entities.c.start_span)
+    ), entity_text, ner_category).where(
+        document_named_entities.c.document_id.in_(document_ids)
+    ).group_by(document_named_entities.c.document_id)
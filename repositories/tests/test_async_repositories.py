@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from models.models import Document, NERSpan
+from repositories.category_query import parse_category_query
+from repositories.async_repositories import AsyncSQLDocumentRepositoryImpl, AsyncSQLNERSpanRepository
+from repositories.repositories import SQLDocumentRepositoryImpl, SQLNERSpanRepository
+
+
+class AsyncSQLLiteRepositoryImplTest(unittest.TestCase):
+    doc_repo = SQLDocumentRepositoryImpl.instance(engine="sqlite", host="", database="ling_508.db")
+    ner_repo = SQLNERSpanRepository.instance(engine="sqlite", host="", database="ling_508.db")
+
+    def setUp(self) -> None:
+        self.async_doc_repo = self.run_async(AsyncSQLDocumentRepositoryImpl.instance(
+            engine="sqlite+aiosqlite", host="", database="ling_508.db"
+        ))
+        self.async_ner_repo = self.run_async(AsyncSQLNERSpanRepository.instance(
+            engine="sqlite+aiosqlite", host="", database="ling_508.db"
+        ))
+        self.docs = [Document(date=datetime.now(), text=f"Obama {i}") for i in range(5)]
+        self.doc_repo.store_many(self.docs)
+        self.ner_repo.store_many([
+            NERSpan.of(document_id=doc.id, start_span=0, end_span=5, ner_tag="S-PERSON", entity_text="Obama")
+            for doc in self.docs
+        ])
+
+    @staticmethod
+    def run_async(coroutine):
+        return asyncio.run(coroutine)
+
+    def test_instance(self):
+        self.assertIs(self.async_doc_repo, self.run_async(AsyncSQLDocumentRepositoryImpl.instance(
+            engine="sqlite+aiosqlite", host="", database="ling_508.db"
+        )))
+
+    def test_find_by_ids(self):
+        ids = [doc.id for doc in self.docs]
+        results = self.run_async(self.async_doc_repo.find_by_ids(ids))
+        self.assertEqual([doc.text for doc in self.docs], [doc.text for doc in results])
+
+        first_page = self.run_async(self.async_doc_repo.find_by_ids_page(ids, limit=3))
+        self.assertEqual(ids[:3], [doc.id for doc in first_page])
+        second_page = self.run_async(self.async_doc_repo.find_by_ids_page(ids, after=first_page[-1].id, limit=3))
+        self.assertEqual(ids[3:], [doc.id for doc in second_page])
+
+    def test_iter_by_ids(self):
+        async def collect():
+            return [doc async for doc in self.async_doc_repo.iter_by_ids(list(reversed(ids)), batch_size=2)]
+
+        ids = [doc.id for doc in self.docs]
+        self.assertEqual(ids, [doc.id for doc in self.run_async(collect())])
+
+    def test_find_document_ids_by_ner_category(self):
+        ids = [doc.id for doc in self.docs]
+        self.assertEqual(ids, self.run_async(self.async_ner_repo.find_document_ids_by_ner_category("PERSON")))
+        self.assertEqual(ids[2:4], self.run_async(self.async_ner_repo.find_document_ids_by_ner_category_page(
+            "PERSON", after=ids[1], limit=2
+        )))
+        self.assertEqual({ids[0]: 0}, self.run_async(self.async_ner_repo.find_first_span_starts("PERSON", [ids[0]])))
+        self.assertEqual(ids[1:3], self.run_async(self.async_ner_repo.find_document_ids_by_category_query(
+            parse_category_query("PERSON AND NOT LAW"), after=ids[0], limit=2
+        )))
+
+    def test_find_document_ids_by_entity(self):
+        ids = [doc.id for doc in self.docs]
+        self.assertEqual(ids[1:3], self.run_async(self.async_ner_repo.find_document_ids_by_entity_page(
+            "obama", ner_category="PERSON", after=ids[0], limit=2
+        )))
+        self.assertEqual({ids[0]: 0}, self.run_async(self.async_ner_repo.find_first_entity_starts(
+            "OBAMA", None, [ids[0]]
+        )))
+
+    def test_find_related_ner_categories(self):
+        self.assertEqual(["PERSON"], self.run_async(self.async_ner_repo.find_related_ner_categories("ers")))
+        self.assertEqual([("PERSON", 5, 5)], [
+            (stats.ner_category, stats.document_count, stats.mention_count)
+            for stats in self.run_async(self.async_ner_repo.find_category_stats(["PERSON", "GPE"]))
+        ])
+
+    def test_reads_go_to_replicas(self):
+        # the replica file only gets the tables, nothing is replicated to it
+        SQLDocumentRepositoryImpl.instance(engine="sqlite", host="", database="ling_508_replica.db")
+        SQLNERSpanRepository.instance(engine="sqlite", host="", database="ling_508_replica.db")
+        replica = "sqlite+aiosqlite:///ling_508_replica.db"
+        primary = "sqlite+aiosqlite:///ling_508.db"
+        ids = [doc.id for doc in self.docs]
+
+        async def find():
+            doc_repo = await AsyncSQLDocumentRepositoryImpl.instance(url=primary, replicas=[replica, primary])
+            ner_repo = await AsyncSQLNERSpanRepository.instance(url=primary, replicas=[replica])
+            try:
+                return [len(await doc_repo.find_by_ids(ids)) for _ in range(4)], \
+                    await ner_repo.find_document_ids_by_ner_category("PERSON")
+            finally:
+                for engine in [doc_repo.db_engine, ner_repo.db_engine] + doc_repo.replica_engines + \
+                        ner_repo.replica_engines:
+                    await engine.dispose()
+
+        self.assertEqual(([0, 5, 0, 5], []), self.run_async(find()))
+
+    def tearDown(self) -> None:
+        # pooled connections are bound to the event loop that opened them, and each run_async uses a new one
+        self.run_async(self.async_doc_repo.db_engine.dispose())
+        self.run_async(self.async_ner_repo.db_engine.dispose())
+        self.doc_repo.truncate()
+        self.ner_repo.truncate()
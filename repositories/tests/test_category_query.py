@@ -0,0 +1,34 @@
+import unittest
+
+from repositories.category_query import AndQuery, CategoryTerm, InvalidCategoryQuery, NotQuery, OrQuery, \
+    parse_category_query
+
+
+class CategoryQueryTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertIsInstance(parse_category_query(" PERSON "), CategoryTerm)
+        self.assertEqual("PERSON", parse_category_query(" PERSON ").ner_category)
+        self.assertEqual("((PERSON AND NOT LAW) OR (GPE AND WORK_OF_ART))",
+                         str(parse_category_query("PERSON and not LAW OR (GPE AND WORK_OF_ART)")))
+
+        query = parse_category_query("PERSON AND (LAW OR ORG)")
+        self.assertIsInstance(query, AndQuery)
+        self.assertIsInstance(query.operands[1], OrQuery)
+        self.assertIsInstance(parse_category_query("PERSON AND NOT NOT LAW").operands[1], NotQuery)
+        self.assertEqual({"PERSON", "LAW", "ORG"}, query.categories())
+
+    def test_matches(self):
+        query = parse_category_query("PERSON AND NOT (LAW OR ORG)")
+        self.assertTrue(query.matches({"PERSON", "GPE"}))
+        self.assertFalse(query.matches({"PERSON", "ORG"}))
+        self.assertFalse(query.matches({"GPE"}))
+
+    def test_invalid(self):
+        for text in ["", "NOT LAW", "PERSON OR NOT LAW", "(PERSON", "PERSON AND", "PERSON LAW", "AND", ")"]:
+            with self.assertRaises(InvalidCategoryQuery, msg=text):
+                parse_category_query(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+from datetime import datetime
+
+from models.models import Document, NERSpan
+from repositories.category_query import parse_category_query
+from repositories.indexes import NERCategoryIndex, NERCategoryDictionary
+from repositories.repositories import SQLDocumentRepositoryImpl, SQLNERSpanRepository
+
+
+class NERCategoryIndexTest(unittest.TestCase):
+    doc_repo = SQLDocumentRepositoryImpl.instance(engine="sqlite", host="", database="ling_508.db")
+    ner_repo = SQLNERSpanRepository.instance(engine="sqlite", host="", database="ling_508.db")
+
+    def store_document(self, text: str, ner_tags) -> Document:
+        doc = Document(date=datetime.now(), text=text)
+        self.doc_repo.store(doc.date, doc)
+        self.ner_repo.store_many([
+            NERSpan.of(document_id=doc.id, start_span=i, end_span=i + 1, ner_tag=ner_tag)
+            for i, ner_tag in enumerate(ner_tags)
+        ])
+        return doc
+
+    def test_refresh(self):
+        doc_1 = self.store_document("Miley Cirus is here", ["B-PERSON", "E-PERSON"])
+        doc_2 = self.store_document("Obama is in Equador", ["S-PERSON", "S-GPE"])
+
+        index = NERCategoryIndex(self.ner_repo, chunk_size=1)
+        self.assertEqual(4, index.refresh())
+        self.assertEqual([doc_1.id, doc_2.id], index.find_document_ids("PERSON"))
+        self.assertEqual([doc_2.id], index.find_document_ids("GPE"))
+        self.assertEqual([], index.find_document_ids("LAW"))
+        self.assertEqual(["GPE", "PERSON"], index.ner_categories())
+
+    def test_refresh_incremental(self):
+        doc_1 = self.store_document("Miley Cirus is here", ["B-PERSON", "E-PERSON"])
+        index = NERCategoryIndex(self.ner_repo)
+        index.refresh()
+
+        doc_2 = self.store_document("Equador passed a law", ["S-GPE", "S-LAW"])
+        self.ner_repo.store_many([NERSpan.of(document_id=doc_1.id, start_span=15, end_span=19, ner_tag="S-LAW")])
+
+        self.assertEqual(3, index.refresh())
+        self.assertEqual(0, index.refresh())
+        self.assertEqual([doc_1.id], index.find_document_ids("PERSON"))
+        self.assertEqual([doc_1.id, doc_2.id], index.find_document_ids("LAW"))
+        self.assertEqual(index.find_document_ids("LAW"), self.ner_repo.find_document_ids_by_ner_category("LAW"))
+
+    def test_refresh_out_of_order_commit(self):
+        """ spans committed below the highest span id seen by the last refresh are picked up by the next one, once
+        """
+        doc_1 = self.store_document("Miley Cirus is here", ["S-PERSON", "S-GPE"])
+        doc_2 = self.store_document("Obama is here", ["S-PERSON"])
+        spans = self.ner_repo.document_named_entities
+        # the span of GPE is committed after the refresh, but with a lower id than the span of doc_2
+        with self.ner_repo.db_engine.begin() as conn:
+            gpe_span = conn.execute(spans.select().where(spans.c.ner_category == "GPE")).fetchone()
+            conn.execute(spans.delete().where(spans.c.id == gpe_span.id))
+        index = NERCategoryIndex(self.ner_repo)
+        self.assertEqual(2, index.refresh())
+        self.assertEqual([], index.find_document_ids("GPE"))
+
+        with self.ner_repo.db_engine.begin() as conn:
+            conn.execute(spans.insert(), dict(gpe_span))
+        self.assertEqual(1, index.refresh())
+        self.assertEqual(0, index.refresh())
+        self.assertEqual([doc_1.id], index.find_document_ids("GPE"))
+        self.assertEqual([doc_1.id, doc_2.id], index.find_document_ids("PERSON"))
+
+    def test_find_document_ids_page(self):
+        docs = [self.store_document(f"Obama {i}", ["S-PERSON"]) for i in range(5)]
+        index = NERCategoryIndex(self.ner_repo)
+        index.refresh()
+
+        first_page = index.find_document_ids_page("PERSON", limit=2)
+        self.assertEqual([doc.id for doc in docs[:2]], first_page)
+        self.assertEqual([doc.id for doc in docs[2:]], index.find_document_ids_page("PERSON", after=first_page[-1]))
+        self.assertEqual([], index.find_document_ids_page("PERSON", after=docs[-1].id))
+        self.assertEqual([], index.find_document_ids_page("LAW"))
+
+    def test_find_document_ids_by_query(self):
+        person_law = self.store_document("Obama signed the act", ["S-PERSON", "S-LAW"])
+        person = self.store_document("Obama is here", ["S-PERSON"])
+        law_gpe = self.store_document("Equador passed a law", ["S-GPE", "S-LAW"])
+        person_gpe = self.store_document("Obama is in Equador", ["S-PERSON", "S-GPE"])
+        index = NERCategoryIndex(self.ner_repo)
+        index.refresh()
+
+        for text, expected_docs in [
+            ("PERSON AND LAW", [person_law]),
+            ("PERSON AND NOT LAW", [person, person_gpe]),
+            ("LAW OR GPE", [person_law, law_gpe, person_gpe]),
+            ("(PERSON OR GPE) AND NOT (LAW AND GPE)", [person_law, person, person_gpe]),
+            ("GPE OR NOT PERSON AND LAW", [law_gpe, person_gpe]),
+            ("PERSON AND ORG", []),
+        ]:
+            query = parse_category_query(text)
+            self.assertEqual([doc.id for doc in expected_docs], index.find_document_ids_by_query(query), text)
+            self.assertEqual(self.ner_repo.find_document_ids_by_category_query(query),
+                             index.find_document_ids_by_query(query), text)
+
+        query = parse_category_query("PERSON AND NOT LAW")
+        self.assertEqual([person_gpe.id], index.find_document_ids_by_query(query, after=person.id, limit=1))
+        self.assertEqual([person_gpe.id], self.ner_repo.find_document_ids_by_category_query(query, after=person.id,
+                                                                                           limit=1))
+
+    def test_refresh_if_stale(self):
+        self.store_document("Miley Cirus is here", ["B-PERSON", "E-PERSON"])
+        index = NERCategoryIndex(self.ner_repo, refresh_interval=3600)
+        index.refresh_if_stale()
+        self.assertEqual(1, len(index.find_document_ids("PERSON")))
+
+        self.store_document("Obama is here", ["S-PERSON"])
+        index.refresh_if_stale()
+        self.assertEqual(1, len(index.find_document_ids("PERSON")))
+
+    def tearDown(self) -> None:
+        self.doc_repo.truncate()
+        self.ner_repo.truncate()
+
+
+class NERCategoryDictionaryTest(unittest.TestCase):
+    ner_repo = SQLNERSpanRepository.instance(engine="sqlite", host="", database="ling_508.db")
+
+    def test_find_related_ner_categories(self):
+        self.ner_repo.store_many([
+            NERSpan.of(document_id=1, start_span=i, end_span=i + 1, ner_tag=ner_tag)
+            for i, ner_tag in enumerate(["B-PERSON", "E-PERSON", "S-PERCENT", "S-LAW", "S-LOC", "S-ORDINAL"])
+        ])
+        dictionary = NERCategoryDictionary(self.ner_repo)
+        dictionary.refresh()
+
+        self.assertEqual(["PERCENT", "PERSON"], dictionary.find_related_ner_categories("per"))
+        self.assertEqual(["LAW", "LOC", "ORDINAL"], dictionary.find_related_ner_categories("L"))
+        self.assertEqual(["PERSON"], dictionary.find_related_ner_categories("rso"))
+        self.assertEqual([], dictionary.find_related_ner_categories("xyz"))
+        self.assertEqual(["LAW", "LOC", "ORDINAL", "PERCENT", "PERSON"], dictionary.find_related_ner_categories(""))
+        for query in ["per", "l", "o", "xyz"]:
+            self.assertEqual(self.ner_repo.find_related_ner_categories(query),
+                             dictionary.find_related_ner_categories(query))
+
+    def tearDown(self) -> None:
+        self.ner_repo.truncate()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+from typing import AsyncIterator, List, Optional, Text, Tuple
+
+from models.models import Document, NERCategoryStats
+from repositories.async_repositories import AsyncSQLDocumentRepositoryImpl, AsyncSQLNERSpanRepository
+from repositories.category_query import CategoryTerm, parse_category_query
+from repositories.repositories import database_replicas, database_settings
+from services.document_pages import document_page, earliest_starts
+
+
+class AsyncWebServiceImpl:
+    """ asyncio counterpart of WebServiceImpl, used by the ASGI app. Every lookup goes to the db through a pooled async
+    connection, so a request waiting on the db does not hold a thread. Unlike WebServiceImpl, it has no in-memory
+    NERCategoryIndex, NERCategoryDictionary or CachedDocumentRepository.
+    """
+    INSTANCE = None
+
+    @staticmethod
+    async def instance(is_test=False):
+        if not AsyncWebServiceImpl.INSTANCE:
+            web_service = AsyncWebServiceImpl()
+            await web_service.init(is_test=is_test)
+            AsyncWebServiceImpl.INSTANCE = web_service
+
+        return AsyncWebServiceImpl.INSTANCE
+
+    def __init__(self):
+        self.db_document_repository: Optional[AsyncSQLDocumentRepositoryImpl] = None
+        self.ner_repository: Optional[AsyncSQLNERSpanRepository] = None
+
+    async def init(self, is_test=False):
+        """ initiate the repositories. This method must be awaited after constructing this object.
+
+        :param is_test:
+        :return:
+        """
+        # the same primary database and replicas as WebServiceImpl, reads are spread over the replicas if any
+        settings = database_settings(is_test, is_async=True)
+        replicas = database_replicas(is_test, is_async=True)
+        self.db_document_repository = await AsyncSQLDocumentRepositoryImpl.instance(**settings, replicas=replicas)
+        self.ner_repository = await AsyncSQLNERSpanRepository.instance(**settings, replicas=replicas)
+
+    async def retrieve_related_ner_categories(self, search_term: str) -> List[str]:
+        return await self.ner_repository.find_related_ner_categories(search_term)
+
+    async def retrieve_related_ner_category_stats(self, search_term: str) -> List[NERCategoryStats]:
+        """ see WebServiceImpl.retrieve_related_ner_category_stats
+
+        :param search_term:
+        :return:
+        """
+        return await self.ner_repository.find_category_stats(
+            await self.ner_repository.find_related_ner_categories(search_term)
+        )
+
+    async def retrieve_category_stats(self, ner_categories: Optional[List[str]] = None) -> List[NERCategoryStats]:
+        """ see WebServiceImpl.retrieve_category_stats
+
+        :param ner_categories:
+        :return:
+        """
+        return await self.ner_repository.find_category_stats(ner_categories)
+
+    async def retrieve_related_documents(self, search_term: Text) -> List[Document]:
+        doc_ids = await self._find_document_ids(search_term)
+        docs = await self.db_document_repository.find_by_ids(doc_ids)
+        return docs
+
+    async def iter_related_documents(self, search_term: Text) -> AsyncIterator[Document]:
+        """ see WebServiceImpl.iter_related_documents
+
+        :param search_term:
+        :return:
+        """
+        doc_ids = await self._find_document_ids(search_term)
+        async for doc in self.db_document_repository.iter_by_ids(doc_ids):
+            yield doc
+
+    async def retrieve_related_documents_page(self, search_term: Text, after: Optional[int] = None, limit: int = 100,
+                                              snippet_size: Optional[int] = None
+                                              ) -> Tuple[List[Document], Optional[int]]:
+        """ see WebServiceImpl.retrieve_related_documents_page
+
+        :param search_term:
+        :param after:
+        :param limit:
+        :param snippet_size:
+        :return:
+        """
+        query = parse_category_query(search_term)
+        if isinstance(query, CategoryTerm):
+            doc_ids = await self.ner_repository.find_document_ids_by_ner_category_page(query.ner_category,
+                                                                                       after=after, limit=limit)
+        else:
+            doc_ids = await self.ner_repository.find_document_ids_by_category_query(query, after=after, limit=limit)
+        if len(doc_ids) == 0:
+            return [], None
+
+        docs = await self.db_document_repository.find_by_ids_page(doc_ids, limit=limit)
+        span_starts = None
+        if snippet_size is not None:
+            span_starts = earliest_starts([
+                await self.ner_repository.find_first_span_starts(ner_category, [doc.id for doc in docs])
+                for ner_category in sorted(query.categories())
+            ])
+        return document_page(doc_ids, docs, limit, starts=span_starts, snippet_size=snippet_size)
+
+    async def _find_document_ids(self, search_term: Text) -> List[int]:
+        query = parse_category_query(search_term)
+        if isinstance(query, CategoryTerm):
+            return await self.ner_repository.find_document_ids_by_ner_category(query.ner_category)
+        return await self.ner_repository.find_document_ids_by_category_query(query)
+
+    async def retrieve_documents_by_entity_page(self, entity_text: Text, ner_category: Optional[Text] = None,
+                                                after: Optional[int] = None, limit: int = 100,
+                                                snippet_size: Optional[int] = None
+                                                ) -> Tuple[List[Document], Optional[int]]:
+        """ see WebServiceImpl.retrieve_documents_by_entity_page
+
+        :param entity_text:
+        :param ner_category:
+        :param after:
+        :param limit:
+        :param snippet_size:
+        :return:
+        """
+        doc_ids = await self.ner_repository.find_document_ids_by_entity_page(entity_text, ner_category=ner_category,
+                                                                             after=after, limit=limit)
+        if len(doc_ids) == 0:
+            return [], None
+
+        docs = await self.db_document_repository.find_by_ids_page(doc_ids, limit=limit)
+        entity_starts = None
+        if snippet_size is not None:
+            entity_starts = await self.ner_repository.find_first_entity_starts(entity_text, ner_category,
+                                                                               [doc.id for doc in docs])
+        return document_page(doc_ids, docs, limit, starts=entity_starts, snippet_size=snippet_size)
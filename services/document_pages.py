@@ -0,0 +1,38 @@
+""" pages of documents returned by the paginated searches, shared by WebServiceImpl and AsyncWebServiceImpl, which
+only differ in how the ids, documents and span starts of a page are read
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models.models import Document, DocumentSnippet
+
+
+def earliest_starts(starts: Iterable[Dict[int, int]]) -> Dict[int, int]:
+    """ merge document id -> start of a span maps, for example one per category of a query, keeping the first start of
+    each document
+
+    :param starts:
+    :return:
+    """
+    earliest: Dict[int, int] = {}
+    for doc_starts in starts:
+        for doc_id, start_span in doc_starts.items():
+            earliest[doc_id] = min(start_span, earliest.get(doc_id, start_span))
+    return earliest
+
+
+def document_page(doc_ids: List[int], docs: List[Document], limit: int, starts: Optional[Dict[int, int]] = None,
+                  snippet_size: Optional[int] = None) -> Tuple[List[Document], Optional[int]]:
+    """ a page of documents and the cursor of the next page
+
+    :param doc_ids: ids of the page, at most limit of them
+    :param docs: the documents of doc_ids
+    :param limit:
+    :param starts: document id -> position to center the snippet of the document around, 0 if missing
+    :param snippet_size: if set, DocumentSnippet of at most snippet_size characters are returned instead of docs
+    :return: the documents of the page, and the last id of the page if it is full or None if this is the last page
+    """
+    next_cursor = doc_ids[-1] if len(doc_ids) == limit else None
+    if snippet_size is not None:
+        starts = starts or {}
+        docs = [DocumentSnippet.of(doc, position=starts.get(doc.id, 0), size=snippet_size) for doc in docs]
+    return docs, next_cursor
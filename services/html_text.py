@@ -0,0 +1,170 @@
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Dict, List, Text
+
+# whitespace only strings made of these characters are collapsed into a single space or newline, like BeautifulSoup
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+# tags that are closed as soon as they are opened, unless they are written <tag/>
+EMPTY_ELEMENT_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta", "param", "source",
+    "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex", "nextid", "spacer"
+}
+# whitespace is kept as is inside these tags
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+# strings inside these tags are not text, BeautifulSoup getText leaves them out
+NON_TEXT_TAGS = {"rt", "rp", "style", "script", "template"}
+# named character references, with or without their trailing semicolon
+ENTITIES: Dict[Text, Text] = {name.rstrip(";"): character for name, character in html5.items()}
+
+
+def html_to_text(html: Text) -> Text:
+    """ text of html, the same as BeautifulSoup(html, "html.parser").getText(), without building a tree. Text without
+    any markup or character reference is returned as is, without parsing it.
+
+    :param html:
+    :return:
+    """
+    if "<" not in html and "&" not in html:
+        if html.strip(ASCII_SPACES) or html == "":
+            return html
+        return "\n" if "\n" in html else " "
+
+    parser = HTMLTextParser()
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.texts)
+
+
+class HTMLTextParser(HTMLParser):
+    """ streaming html.parser tokenizer that keeps the text, following the tree building rules of BeautifulSoup that
+    change it: which tags are open, when consecutive strings are merged, and how whitespace only strings and character
+    references are converted. Feed it the html, close it, and join texts.
+    """
+
+    def __init__(self):
+        super(HTMLTextParser, self).__init__(convert_charrefs=False)
+        self.texts: List[Text] = []
+        self.data: List[Text] = []
+        self.open_tags: List[Text] = []
+        self.open_tag_counts: Dict[Text, int] = {}
+        self.n_open_non_text_tags = 0
+        self.n_open_preserve_whitespace_tags = 0
+        self.already_closed_empty_elements: List[Text] = []
+
+    def end_data(self, is_text: bool = True) -> None:
+        """ end the current string, and keep it if it is text
+
+        :param is_text: False for comments, declarations and processing instructions
+        :return:
+        """
+        if not self.data:
+            return
+
+        data = "".join(self.data)
+        self.data = []
+        if not is_text:
+            return
+        if self.n_open_preserve_whitespace_tags == 0 and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        self.texts.append(data)
+
+    def push_tag(self, name: Text) -> None:
+        self.open_tags.append(name)
+        self.open_tag_counts[name] = self.open_tag_counts.get(name, 0) + 1
+        if name in NON_TEXT_TAGS:
+            self.n_open_non_text_tags += 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.n_open_preserve_whitespace_tags += 1
+
+    def pop_tag(self) -> Text:
+        name = self.open_tags.pop()
+        self.open_tag_counts[name] -= 1
+        if name in NON_TEXT_TAGS:
+            self.n_open_non_text_tags -= 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.n_open_preserve_whitespace_tags -= 1
+        return name
+
+    def pop_to_tag(self, name: Text) -> None:
+        """ close name and every tag opened after it, if name is open
+
+        :param name:
+        :return:
+        """
+        if not self.open_tag_counts.get(name):
+            return
+        while self.pop_tag() != name:
+            pass
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag)
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.end_data(is_text=self.n_open_non_text_tags == 0)
+        self.push_tag(tag)
+        if handle_empty_element and tag in EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_empty_elements.append(tag)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_empty_elements:
+            # end tag of an empty element, which is already closed
+            self.already_closed_empty_elements.remove(tag)
+            return
+        self.end_data(is_text=self.n_open_non_text_tags == 0)
+        self.pop_to_tag(tag)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith("x"):
+            codepoint = int(name.lstrip("x"), 16)
+        elif name.startswith("X"):
+            codepoint = int(name.lstrip("X"), 16)
+        else:
+            codepoint = int(name)
+
+        data = None
+        if codepoint < 256:
+            # references below 256 are often meant as windows-1252, for example &#147; for a left double quote
+            try:
+                data = bytearray([codepoint]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        character = ENTITIES.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self.end_data(is_text=self.n_open_non_text_tags == 0)
+        self.data.append(data)
+        self.end_data(is_text=False)
+
+    def handle_decl(self, decl):
+        self.handle_comment(decl)
+
+    def handle_pi(self, data):
+        self.handle_comment(data)
+
+    def unknown_decl(self, data):
+        self.end_data(is_text=self.n_open_non_text_tags == 0)
+        if data.upper().startswith("CDATA["):
+            # cdata sections are text, even inside non text tags
+            self.data.append(data[len("CDATA["):])
+            self.end_data(is_text=True)
+        else:
+            self.data.append(data)
+            self.end_data(is_text=False)
+
+    def close(self):
+        super(HTMLTextParser, self).close()
+        self.end_data(is_text=self.n_open_non_text_tags == 0)
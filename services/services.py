@@ -1,39 +1,166 @@
+import collections
+import itertools
 import logging
+import multiprocessing
+import multiprocessing.pool
+import os
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Text, List, Tuple
-
-import stanza
-from bs4 import BeautifulSoup
-
-from models.models import Document, RawDocument, NERSpan
-from repositories.repositories import WebDocumentRepositoryImpl, SQLDocumentRepositoryImpl, SQLNERSpanRepository
-
-
-def process(is_test: bool):
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, Text, List, Optional, Tuple
+
+from metrics.metrics import StageTimer
+from models.models import Document, RawDocument, NERSpan, NERSpanBatch
+from services.html_text import html_to_text
+from repositories.repositories import WebDocumentRepositoryImpl, SQLDocumentRepositoryImpl, SQLNERSpanRepository, \
+    SQLIngestCheckpointRepository, SQLNERCacheRepository, database_settings
+
+if TYPE_CHECKING:
+    import stanza
+
+
+def process(is_test: bool, batch_size: int = 32, n_workers: int = 1, offset: Optional[int] = None,
+            limit: Optional[int] = WebDocumentRepositoryImpl.limit):
+    """ extract, clean and store documents from the web, then extract and store their named entities. Documents are
+    read from the source lazily, one batch at a time, so memory does not grow with limit.
+
+    Ingestion is idempotent and resumable: documents whose text is already stored are skipped before NER, and the
+    source offset is checkpointed after each batch is stored, so a rerun continues where the last run stopped.
+
+    :param is_test:
+    :param batch_size: number of documents that are sent to the NER pipeline in one call
+    :param n_workers: if more than 1, cleaning and NER of each batch are done in a pool of n_workers processes, each
+        with its own stanza pipeline. Persistence is always done in this process, in the original document order.
+    :param offset: number of source documents to skip, None to resume from the last checkpoint
+    :param limit: index of the source document to stop before, counted from the start of the source rather than from
+        offset, so that a run resumed from the checkpoint stops where the interrupted run would have. None to process
+        all of them
+    :return: time spent in each stage of the run, which is also logged as a summary
+    """
     scrapper_service = ScrapyScrapperService.instance(is_test=is_test)
     ne_service = StanzaNERExtractionService.instance(is_test=is_test)
 
-    logging.debug("extracting document from the web....")
-    raw_docs: List[RawDocument] = scrapper_service.extract(date=datetime.now())
-
     if is_test:
-        raw_docs = raw_docs[:2]
-
-    for raw_doc in raw_docs:
-        doc = scrapper_service.clean_html(raw_doc)
-        logging.debug(f"storing document to persistence {raw_doc}")
-        scrapper_service.store_document(doc)
-
-        logging.debug(f"extracting ner from document={raw_doc}")
-        raw_ne_spans: List[Tuple[int, int, Text]] = ne_service.extract(doc)
-        ner_spans: List[NERSpan] = [
-            NERSpan.of(start_span=start_span, end_span=end_span, document_id=doc.id, ner_tag=ner_tag)
-            for (start_span, end_span, ner_tag)
-            in raw_ne_spans
-        ]
-        logging.debug(f"storing ner_spans={ner_spans}")
-        ne_service.store(ner_spans)
+        limit = 2
+    if offset is None:
+        offset = scrapper_service.load_checkpoint()
+
+    logging.debug(f"extracting document from the web, starting at offset={offset} until {limit}....")
+    raw_docs: Iterator[RawDocument] = scrapper_service.extract_iter(
+        date=datetime.now(), offset=offset, limit=None if limit is None else max(0, limit - offset)
+    )
+    shards: Iterator[List[RawDocument]] = iter(lambda: list(itertools.islice(raw_docs, batch_size)), [])
+
+    run_timer = StageTimer()
+    if n_workers <= 1:
+        for shard in shards:
+            batch_timer = StageTimer()
+            n_raw_docs, docs, batch_raw_ne_spans = _clean_and_extract(shard, scrapper_service, ne_service,
+                                                                      batch_timer)
+            _store_batch(docs, batch_raw_ne_spans, scrapper_service, ne_service, batch_timer)
+            offset += n_raw_docs
+            with batch_timer.stage("store_checkpoint", n_raw_docs):
+                scrapper_service.store_checkpoint(offset)
+            run_timer.add(batch_timer)
+    else:
+        # spawn instead of fork, torch does not survive being forked after it has been initialized
+        with multiprocessing.get_context("spawn").Pool(n_workers, initializer=_init_ingest_worker,
+                                                       initargs=(ne_service.lang, is_test)) as pool:
+            for n_raw_docs, docs, batch_raw_ne_spans, batch_timer in _imap_bounded(pool, _ingest_shard, shards,
+                                                                                   max_pending=2 * n_workers):
+                _store_batch(docs, batch_raw_ne_spans, scrapper_service, ne_service, batch_timer)
+                offset += n_raw_docs
+                with batch_timer.stage("store_checkpoint", n_raw_docs):
+                    scrapper_service.store_checkpoint(offset)
+                run_timer.add(batch_timer)
+
+    logging.info(f"ingestion stopped at offset={offset}, time spent per stage:\n{run_timer.summary()}")
+    return run_timer
+
+
+def _imap_bounded(pool: multiprocessing.pool.Pool, func: Callable, iterable: Iterable, max_pending: int) -> Iterator:
+    """ ordered pool.imap that reads at most max_pending items of iterable ahead of the results being consumed.
+    pool.imap reads the whole iterable up front, which would load the whole corpus into memory.
+
+    :param pool:
+    :param func:
+    :param iterable:
+    :param max_pending:
+    :return:
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _clean_and_extract(raw_docs: List[RawDocument], scrapper_service: "ScrapperService",
+                       ne_service: "NERExtractionService", timer: StageTimer) \
+        -> Tuple[int, List[Document], List[List[Tuple[int, int, Text]]]]:
+    """ clean raw_docs, drop the ones that are already stored, and extract named entities from the rest
+
+    :param raw_docs:
+    :param scrapper_service:
+    :param ne_service:
+    :param timer: timer of the batch, filled with the clean_html, filter_new_documents and extract stages
+    :return: number of raw_docs, the new documents, and the named entity spans of each new document
+    """
+    with timer.stage("clean_html", len(raw_docs)):
+        docs: List[Document] = scrapper_service.clean_many(raw_docs)
+    with timer.stage("filter_new_documents", len(docs)):
+        docs = scrapper_service.filter_new_documents(docs)
+    logging.debug(f"extracting ner from {len(docs)} new documents out of {len(raw_docs)}")
+    with timer.stage("extract", len(docs)):
+        batch_raw_ne_spans = ne_service.extract_batch(docs)
+    return len(raw_docs), docs, batch_raw_ne_spans
+
+
+def _store_batch(docs: List[Document], batch_raw_ne_spans: List[List[Tuple[int, int, Text]]],
+                 scrapper_service: "ScrapperService", ne_service: "NERExtractionService", timer: StageTimer) -> None:
+    logging.debug(f"storing {len(docs)} documents to persistence")
+    with timer.stage("store_documents", len(docs)):
+        scrapper_service.store_documents(docs)
+
+    ner_spans = NERSpanBatch()
+    for doc, raw_ne_spans in zip(docs, batch_raw_ne_spans):
+        if doc.id is None:
+            # not stored, most likely because another run stored the same text in the meantime
+            continue
+        # one span per entity mention rather than per token, with the surface text of the mention
+        ner_spans.extend(doc.id, raw_ne_spans, text=doc.text)
+    logging.debug(f"storing {len(ner_spans)} entity mentions of {len(docs)} documents")
+    with timer.stage("store_ner_spans", len(docs)):
+        ne_service.store_batch(ner_spans)
+
+
+# services of the current ingestion worker process, see _init_ingest_worker
+_INGEST_WORKER_SERVICES = None
+
+
+def _init_ingest_worker(lang: str, is_test: bool) -> None:
+    """ initialize an ingestion worker process, the stanza pipeline is loaded only once per worker. The worker only
+    reads from the db, to skip the documents that are already stored.
+
+    :param lang:
+    :param is_test:
+    :return:
+    """
+    global _INGEST_WORKER_SERVICES
+    ne_service = StanzaNERExtractionService(lang=lang, persistent=False,
+                                            cache=StanzaNERExtractionService.default_cache(is_test))
+    if ne_service.cache is None:
+        # load the pipeline now instead of while handling the first shard, with a cache it may not be needed at all
+        ne_service.warm_up()
+    _INGEST_WORKER_SERVICES = (ScrapyScrapperService(is_test=is_test), ne_service)
+
+
+def _ingest_shard(raw_docs: List[RawDocument]) \
+        -> Tuple[int, List[Document], List[List[Tuple[int, int, Text]]], StageTimer]:
+    scrapper_service, ne_service = _INGEST_WORKER_SERVICES
+    timer = StageTimer()
+    return _clean_and_extract(raw_docs, scrapper_service, ne_service, timer) + (timer,)
 
 
 def teardown_process():
@@ -59,19 +186,66 @@ class ScrapperService(ABC):
         """
         pass
 
+    @abstractmethod
+    def extract_iter(self, date: datetime, offset: int = 0, limit: Optional[int] = None) -> Iterator[RawDocument]:
+        """ Lazily extract article data from the web.
+        :param date: article date
+        :param offset: number of articles to skip
+        :param limit: maximum number of articles, None for all of them
+        :return:
+        """
+        pass
+
     @abstractmethod
     def clean_html(self, raw_document: RawDocument) -> Document:
         pass
 
+    @abstractmethod
+    def clean_many(self, raw_documents: List[RawDocument],
+                   pool: Optional[multiprocessing.pool.Pool] = None) -> List[Document]:
+        """ clean_html of every raw document, in order
+        :param raw_documents:
+        :param pool: if set, documents are cleaned by the processes of this pool
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def filter_new_documents(self, documents: List[Document]) -> List[Document]:
+        """ Drop the documents whose text is already stored, or appears earlier in documents.
+        :param documents:
+        :return:
+        """
+        pass
+
     @abstractmethod
     def store_document(self, document: Document) -> None:
         pass
 
+    @abstractmethod
+    def store_documents(self, documents: List[Document]) -> None:
+        pass
+
+    @abstractmethod
+    def load_checkpoint(self) -> int:
+        """ Offset of the next source article to ingest, as saved by store_checkpoint.
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def store_checkpoint(self, offset: int) -> None:
+        pass
+
 
 class ScrapyScrapperService(ScrapperService):
     """ Scraping by using scrapy library
     """
     INSTANCE = None
+    # name of the source of WebDocumentRepositoryImpl documents in the ingest checkpoints
+    CHECKPOINT_SOURCE = "multi_news"
+    # number of documents sent at once to a worker of the pool of clean_many
+    CLEAN_MANY_CHUNK_SIZE = 64
 
     @staticmethod
     def instance(is_test=False):
@@ -82,38 +256,60 @@ class ScrapyScrapperService(ScrapperService):
 
     def __init__(self, is_test=False):
         self.web_document_repository = WebDocumentRepositoryImpl()
-        if is_test:
-            self.db_document_repository = SQLDocumentRepositoryImpl.instance(
-                host="",
-                database="ling_508.db",
-                engine="sqlite"
-            )
-            return
-
-        self.db_document_repository = SQLDocumentRepositoryImpl.instance(
-            host="localhost",
-            database="ling_508",
-            engine="mysql+pymysql",
-            user="root",
-            password="root"
-        )
+        self.db_document_repository = SQLDocumentRepositoryImpl.instance(**database_settings(is_test))
+        self.checkpoint_repository = SQLIngestCheckpointRepository.instance(**database_settings(is_test))
 
     def extract(self, date: datetime) -> List[RawDocument]:
         return self.web_document_repository.retrieve(date=date)
 
+    def extract_iter(self, date: datetime, offset: int = 0, limit: Optional[int] = None) -> Iterator[RawDocument]:
+        return self.web_document_repository.retrieve_iter(date=date, offset=offset, limit=limit)
+
     def clean_html(self, raw_document: RawDocument) -> Document:
-        soup = BeautifulSoup(raw_document.text, "html.parser")
-        raw_document.text = soup.getText()
+        raw_document.text = html_to_text(raw_document.text)
         return raw_document
 
+    def clean_many(self, raw_documents: List[RawDocument],
+                   pool: Optional[multiprocessing.pool.Pool] = None) -> List[Document]:
+        if pool is None:
+            return [self.clean_html(raw_document) for raw_document in raw_documents]
+
+        texts = pool.map(html_to_text, [raw_document.text for raw_document in raw_documents],
+                         chunksize=self.CLEAN_MANY_CHUNK_SIZE)
+        for raw_document, text in zip(raw_documents, texts):
+            raw_document.text = text
+        return raw_documents
+
+    def filter_new_documents(self, documents: List[Document]) -> List[Document]:
+        documents_by_hash: Dict[str, Document] = {}
+        for document in documents:
+            documents_by_hash.setdefault(document.content_hash, document)
+
+        stored_ids = self.db_document_repository.find_ids_by_content_hashes(list(documents_by_hash.keys()))
+        return [
+            document
+            for content_hash, document in documents_by_hash.items()
+            if content_hash not in stored_ids
+        ]
+
     def store_document(self, document: Document) -> None:
         self.db_document_repository.store(document.date, document)
 
+    def store_documents(self, documents: List[Document]) -> None:
+        self.db_document_repository.store_many(documents)
+
+    def load_checkpoint(self) -> int:
+        return self.checkpoint_repository.find_offset(self.CHECKPOINT_SOURCE)
+
+    def store_checkpoint(self, offset: int) -> None:
+        self.checkpoint_repository.store_offset(self.CHECKPOINT_SOURCE, offset)
+
     def empty_db(self) -> None:
         """ Only used at tests, empty the db after running integration tests
         :return:
         """
         self.db_document_repository.truncate()
+        self.checkpoint_repository.truncate()
 
 
 class NERExtractionService(ABC):
@@ -128,44 +324,112 @@ class NERExtractionService(ABC):
         """
         pass
 
+    @abstractmethod
+    def extract_batch(self, docs: List[Document]) -> List[List[Tuple[int, int, Text]]]:
+        """ extract named entities from many documents at once.
+        :param docs:
+        :return: one list of (start_span, end_span, ner_category) tuples per document, in the same order as docs
+        """
+        pass
+
     @abstractmethod
     def store(self, ner_spans: List[NERSpan]) -> None:
         pass
 
+    @abstractmethod
+    def store_batch(self, ner_spans: NERSpanBatch) -> None:
+        pass
+
 
 class StanzaNERExtractionService(NERExtractionService):
     """ NER extraction by using Stanford's stanza model
     """
 
     INSTANCE = None
+    PROCESSORS = "tokenize,ner"
 
     @staticmethod
     def instance(lang="en", is_test=False):
         if not StanzaNERExtractionService.INSTANCE:
-            StanzaNERExtractionService.INSTANCE = StanzaNERExtractionService(lang=lang, is_test=is_test)
+            StanzaNERExtractionService.INSTANCE = StanzaNERExtractionService(
+                lang=lang,
+                is_test=is_test,
+                cache=StanzaNERExtractionService.default_cache(is_test)
+            )
 
         return StanzaNERExtractionService.INSTANCE
 
-    def __init__(self, lang="en", is_test=False):
-        self.NLP = stanza.Pipeline(lang=lang, processors="tokenize,ner")
+    @staticmethod
+    def default_cache(is_test=False, database: Optional[str] = None) -> Optional[SQLNERCacheRepository]:
+        """ the ner cache of the ingestion, a sqlite file set by the NER_CACHE_DATABASE environment variable. It is
+        disabled unless NER_CACHE_DATABASE is set. Tests use ner_cache_test.db, so that they never touch the cache of a
+        real ingestion.
+
+        :param is_test:
+        :param database: path of the sqlite file, overrides NER_CACHE_DATABASE
+        :return:
+        """
         if is_test:
-            self.ne_repo = SQLNERSpanRepository.instance(
-                host="",
-                database="ling_508.db",
-                engine="sqlite"
-            )
+            return SQLNERCacheRepository.instance(database="ner_cache_test.db")
+
+        if database is None:
+            database = os.environ.get("NER_CACHE_DATABASE")
+        if not database:
+            return None
+        return SQLNERCacheRepository.instance(database=database)
+
+    def __init__(self, lang="en", is_test=False, persistent=True, cache: Optional[SQLNERCacheRepository] = None):
+        """
+
+        :param lang:
+        :param is_test:
+        :param persistent: if False, the service does not connect to the db and can only extract named entities
+        :param cache: if set, spans of texts that were already extracted are read from it instead of running the model
+        """
+        self.lang = lang
+        self._nlp = None
+        self._model_version = None
+        self.cache = cache
+        if not persistent:
+            self.ne_repo = None
             return
 
-        self.ne_repo = SQLNERSpanRepository.instance(
-            host="localhost",
-            database="ling_508",
-            engine="mysql+pymysql",
-            user="root",
-            password="root"
-        )
+        self.ne_repo = SQLNERSpanRepository.instance(**database_settings(is_test))
 
-    def extract(self, doc: Document) -> List[Tuple[int, int, Text]]:
-        parsed_doc = self.NLP(doc.text)
+    @property
+    def NLP(self) -> "stanza.Pipeline":
+        """ stanza pipeline, loaded on first use so that services which only store spans do not pay for the model
+
+        :return:
+        """
+        self.warm_up()
+        return self._nlp
+
+    def warm_up(self) -> None:
+        """ load the stanza pipeline now rather than on the first extraction, does nothing if it is already loaded
+
+        :return:
+        """
+        if self._nlp is None:
+            # stanza pulls in torch, it is only imported once a pipeline is actually needed
+            import stanza
+
+            self._nlp = stanza.Pipeline(lang=self.lang, processors=self.PROCESSORS)
+
+    @property
+    def model_version(self) -> str:
+        """ identifies the spans this service extracts, the stanza version decides which models are downloaded
+
+        :return:
+        """
+        if self._model_version is None:
+            import stanza
+
+            self._model_version = f"stanza={stanza.__version__};lang={self.lang};processors={self.PROCESSORS}"
+        return self._model_version
+
+    @staticmethod
+    def _ner_spans(parsed_doc: "stanza.Document") -> List[Tuple[int, int, Text]]:
         results: List[Tuple[int, int, Text]] = []
         for sentence in parsed_doc.sentences:
             for token in sentence.tokens:
@@ -177,76 +441,67 @@ class StanzaNERExtractionService(NERExtractionService):
                     ))
         return results
 
-    def store(self, ner_spans: List[NERSpan]) -> None:
-        """ Store all the ner_spans into persistence
+    def extract(self, doc: Document) -> List[Tuple[int, int, Text]]:
+        if self.cache is not None:
+            return self.extract_batch([doc])[0]
 
-        :param ner_spans:
-        :return:
-        """
-        for ner_span in ner_spans:
-            self.ne_repo.store(ner_span)
+        parsed_doc = self.NLP(doc.text)
+        return self._ner_spans(parsed_doc)
 
-    def empty_db(self) -> None:
-        """ Only used at tests, empty the db after running integration tests
+    def extract_batch(self, docs: List[Document]) -> List[List[Tuple[int, int, Text]]]:
+        """ extract named entities from all docs with a single bulk call to the stanza pipeline. Spans offsets are
+        relative to each document's own text. With a cache, only the texts that are not cached yet are sent to the
+        pipeline, and their spans are cached.
+
+        :param docs:
         :return:
         """
-        self.ne_repo.truncate()
+        if len(docs) == 0:
+            return []
+        if self.cache is None:
+            return self._extract_batch(docs)
 
+        model_version = self.model_version
+        cache_keys = [SQLNERCacheRepository.cache_key(doc.text, model_version) for doc in docs]
+        batch_ne_spans = self.cache.find_many(cache_keys)
 
-class WebService(ABC):
+        missing_docs: Dict[str, Document] = {}
+        for cache_key, doc in zip(cache_keys, docs):
+            if cache_key not in batch_ne_spans:
+                missing_docs.setdefault(cache_key, doc)
+        if missing_docs:
+            extracted = dict(zip(missing_docs.keys(), self._extract_batch(list(missing_docs.values()))))
+            self.cache.store_many(extracted)
+            batch_ne_spans.update(extracted)
 
-    @abstractmethod
-    def retrieve_related_ner_categories(self, search_term: str) -> List[str]:
-        pass
+        return [list(batch_ne_spans[cache_key]) for cache_key in cache_keys]
 
-    @abstractmethod
-    def retrieve_related_documents(self, search_term: str) -> List[Document]:
-        pass
+    def _extract_batch(self, docs: List[Document]) -> List[List[Tuple[int, int, Text]]]:
+        import stanza
 
+        parsed_docs = self.NLP([stanza.Document([], text=doc.text) for doc in docs])
+        return [self._ner_spans(parsed_doc) for parsed_doc in parsed_docs]
 
-class WebServiceImpl(WebService):
-    INSTANCE = None
+    def store(self, ner_spans: List[NERSpan]) -> None:
+        """ Store all the ner_spans into persistence, in a single transaction
 
-    @staticmethod
-    def instance(is_test=False):
-        if not WebServiceImpl.INSTANCE:
-            WebServiceImpl.INSTANCE = WebServiceImpl(is_test=is_test)
+        :param ner_spans:
+        :return:
+        """
+        self.ne_repo.store_many(ner_spans)
 
-        return WebServiceImpl.INSTANCE
+    def store_batch(self, ner_spans: NERSpanBatch) -> None:
+        """ same as store, for spans in columnar form
 
-    def __init__(self, is_test=False):
-        if is_test:
-            self.db_document_repository = SQLDocumentRepositoryImpl.instance(
-                host="",
-                database="ling_508.db",
-                engine="sqlite"
-            )
-            self.ner_repository = SQLNERSpanRepository.instance(
-                host="",
-                database="ling_508.db",
-                engine="sqlite"
-            )
-            return
+        :param ner_spans:
+        :return:
+        """
+        self.ne_repo.store_batch(ner_spans)
 
-        self.db_document_repository = SQLDocumentRepositoryImpl.instance(
-            host="localhost",
-            database="ling_508",
-            engine="mysql+pymysql",
-            user="root",
-            password="root"
-        )
-        self.ner_repository = SQLNERSpanRepository.instance(
-            host="localhost",
-            database="ling_508",
-            engine="mysql+pymysql",
-            user="root",
-            password="root"
-        )
-
-    def retrieve_related_ner_categories(self, search_term: str) -> List[str]:
-        return self.ner_repository.find_related_ner_categories(search_term)
-
-    def retrieve_related_documents(self, search_term: Text) -> List[Document]:
-        doc_ids = self.ner_repository.find_document_ids_by_ner_category(search_term)
-        docs = self.db_document_repository.find_by_ids(doc_ids)
-        return docs
+    def empty_db(self) -> None:
+        """ Only used at tests, empty the db after running integration tests
+        :return:
+        """
+        self.ne_repo.truncate()
+        if self.cache is not None:
+            self.cache.truncate()
@@ -1,9 +1,12 @@
 import datetime
+import multiprocessing
+import random
 import unittest
 from datetime import datetime
 from unittest import mock
 
 from models.models import Document, RawDocument
+from repositories.repositories import SQLNERCacheRepository, WebDocumentRepositoryImpl
 from services.services import ScrapyScrapperService, process, teardown_process
 from services.services import StanzaNERExtractionService
 
@@ -40,6 +43,99 @@ It's my life!"""
         cleaned_text = self.service.clean_html(raw_document)
         self.assertTrue(expected_text, cleaned_text)
 
+    def test_clean_html_matches_beautifulsoup(self):
+        from bs4 import BeautifulSoup
+
+        sample_htmls = [
+            "",
+            "   \n  ",
+            "no markup at all",
+            "Tom &amp; Jerry &foo; &#150; &#x41;&nbsp;<br>end",
+            "<p>one</p>  <p>two</p>\n<br/></br><pre>  </pre><textarea> </textarea>",
+            "<script>var a = '<p>';</script><style>p {}</style><template><b>t</b><![CDATA[ cdata ]]></template>",
+            "<!DOCTYPE html><!-- comment --><?xml version?><![if x]><ruby>kan<rp>(</rp><rt>kan</rt></ruby>",
+            "<div><p>unclosed <b>tags</div> after < 3 > 2",
+            # unclosed and misnested tags
+            "<p>first<p>second<p>third",
+            "<ul><li>one<li>two</ul><p>after",
+            "<p>unclosed <b>bold <i>italic",
+            "<b><i>overlapping</b></i>",
+            "<div><span>a</div></span>b",
+            "</p>stray end tags</div></b>",
+            "<option>a<option>b<select><option>c</select>",
+            # script and style
+            "<script>if (a < b && c > d) { document.write('</p>'); }</script>text",
+            "<style>/* <b> */ p { color: red }</style><p>styled</p>",
+            "<SCRIPT type='text/javascript'>x = 1;</SCRIPT>after script",
+            "<script>unclosed script <p>inside",
+            "<noscript>no script</noscript><iframe>frame text</iframe>",
+            # cdata, comments, declarations and processing instructions
+            "<![CDATA[ <b>not a tag</b> & not an entity ]]>",
+            "<p><![CDATA[x]]>y<![cdata[z]]></p>",
+            "<!-- unclosed comment",
+            "<!-- a --><!----><!--- b --->c",
+            "<?php echo 'x'; ?>after pi",
+            "<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.0//EN\"><html><head><title>T</title></head><body>B</body></html>",
+            # entities, in text and in attributes
+            '<a href="?a=1&amp;b=2&c=3" title="Tom &amp; Jerry &quot;quoted&quot;">link &amp; text</a>',
+            "<img alt='&lt;alt&gt;' src=x.png>after image",
+            "<p title='a > b'>gt in attribute</p>",
+            "a &lt; b &gt c &amp d &copy &copy; &unknown; &#0; &#1114112; &#xD800; &#128; &#x9F;",
+            "<p>caf&eacute; na&iuml;ve &mdash; &hellip; &rsquo;&ldquo;</p>",
+            "<div>&#147;quoted&#148; &#8220;smart&#8221; &#x201C;hex&#x201D;</div>",
+            # nested tables
+            "<table><tr><td>a<table><tr><td>nested</td></tr></table></td><td>b</td></tr></table>",
+            "<table><tr><td>unclosed cell<td>second<tr><td>row two</table>tail",
+            # whitespace
+            "<pre>\n  keep   spaces \n</pre>  \n\n  <p>x</p>",
+            "<textarea>  <b>raw</b>  </textarea>",
+            "<p>\t\n</p><p> \r\n </p>",
+            "text < not a tag and <3 and a<b",
+            "<template><p>hidden</p></template>shown",
+            "<svg><text>svg text</text></svg><math><mi>x</mi></math>",
+        ]
+        for sample_html in sample_htmls:
+            raw_document = RawDocument(date=datetime.now(), text=sample_html)
+            self.assertEqual(BeautifulSoup(sample_html, "html.parser").getText(),
+                             self.service.clean_html(raw_document).text, sample_html)
+
+    def test_clean_html_matches_beautifulsoup_random(self):
+        """ random sequences of tags, character references and text, most of them malformed
+        """
+        from bs4 import BeautifulSoup
+
+        fragments = [
+            "<p>", "</p>", "<b>", "</b>", "<br>", "<br/>", "</br>", "<pre>", "</pre>", "<script>", "</script>",
+            "<style>", "</style>", "<table>", "<td>", "</td>", "<tr>", "</table>", "<textarea>", "</textarea>", "<rt>",
+            "</rt>", "<![CDATA[c]]>", "<!--c-->", "<img src='&amp;'>", "<a href='x?a=1&b=2'>", "</a>", "&amp;",
+            "&nbsp", "&#150;", "&#x41;", "&bogus;", " ", "\n", "  \n  ", "text", "\u00e9", "<", ">", "&"
+        ]
+        rnd = random.Random(508)
+        for _ in range(2000):
+            sample_html = "".join(rnd.choice(fragments) for _ in range(rnd.randint(1, 25)))
+            raw_document = RawDocument(date=datetime.now(), text=sample_html)
+            self.assertEqual(BeautifulSoup(sample_html, "html.parser").getText(),
+                             self.service.clean_html(raw_document).text, sample_html)
+
+    def test_clean_html_matches_beautifulsoup_multi_news(self):
+        """ the documents that the ingestion actually cleans
+        """
+        from bs4 import BeautifulSoup
+
+        for raw_document in WebDocumentRepositoryImpl().retrieve_iter(date=datetime.now(), limit=1000):
+            expected_text = BeautifulSoup(raw_document.text, "html.parser").getText()
+            self.assertEqual(expected_text, self.service.clean_html(raw_document).text)
+
+    def test_clean_many(self):
+        sample_htmls = [f"<p>document {i}</p>" for i in range(100)]
+        with multiprocessing.get_context("spawn").Pool(2) as pool:
+            docs = self.service.clean_many([RawDocument(date=datetime.now(), text=html) for html in sample_htmls],
+                                           pool=pool)
+        self.assertEqual([f"document {i}" for i in range(100)], [doc.text for doc in docs])
+        self.assertEqual(["a"], [doc.text for doc in self.service.clean_many([
+            RawDocument(date=datetime.now(), text="<b>a</b>")
+        ])])
+
     @mock.patch("services.tests.test_services.ScrapyScrapperServiceTest.service.db_document_repository")
     def test_store_document(self, mock_repository):
         """ test store documents into mocked db
@@ -53,6 +149,30 @@ It's my life!"""
         self.service.store_document(doc)
         self.assertTrue(mock_repository.store.called)
 
+    def test_filter_new_documents(self):
+        stored_doc = Document(date=datetime.now(), text="already stored")
+        self.service.store_document(stored_doc)
+
+        docs = [
+            Document(date=datetime.now(), text="already stored"),
+            Document(date=datetime.now(), text="new text"),
+            Document(date=datetime.now(), text="new text"),
+        ]
+        new_docs = self.service.filter_new_documents(docs)
+        self.assertEqual([docs[1]], new_docs)
+
+    def test_checkpoint(self):
+        self.assertEqual(0, self.service.load_checkpoint())
+        self.service.store_checkpoint(32)
+        self.assertEqual(32, self.service.load_checkpoint())
+
+    @mock.patch("services.tests.test_services.ScrapyScrapperServiceTest.service.db_document_repository")
+    def test_store_documents(self, mock_repository):
+        docs = [Document(date=datetime.now(), text="some random text"), Document(date=datetime.now(), text="more")]
+
+        self.service.store_documents(docs)
+        mock_repository.store_many.assert_called_once_with(docs)
+
     def tearDown(self) -> None:
         self.service.empty_db()
 
@@ -71,11 +191,136 @@ class NERExtractionServiceTest(unittest.TestCase):
         self.assertEqual("Obama", text[results[1][0]:results[1][1]])
         self.assertEqual("E-PERSON", results[1][2])
 
+    def test_extract_batch(self):
+        text_1 = "Barrack Obama and Donald Trump have finally agreed on Equador."
+        text_2 = "Miley Cirus is here"
+        doc_1 = Document(id=33, date=datetime.now(), text=text_1)
+        doc_2 = Document(id=34, date=datetime.now(), text=text_2)
+        ner_tagger_service = StanzaNERExtractionService.instance()
+        results = ner_tagger_service.extract_batch([doc_1, doc_2])
+        self.assertEqual(2, len(results))
+        self.assertEqual(ner_tagger_service.extract(doc_1), results[0])
+        self.assertEqual(ner_tagger_service.extract(doc_2), results[1])
+        self.assertEqual("Barrack", text_1[results[0][0][0]:results[0][0][1]])
+
+
+class NERExtractionServiceCacheTest(unittest.TestCase):
+    cache = SQLNERCacheRepository.instance(database="ner_cache_test.db")
+    service = StanzaNERExtractionService(persistent=False, cache=cache)
+
+    def test_extract_batch_cached(self):
+        docs = [Document(date=datetime.now(), text=text) for text in ["Obama is here", "nothing", "Obama is here"]]
+        with mock.patch.object(self.service, "_extract_batch",
+                               side_effect=lambda batch: [[(0, 5, "S-PERSON")] for _ in batch]) as mock_extract:
+            results = self.service.extract_batch(docs)
+            self.assertEqual([[(0, 5, "S-PERSON")]] * 3, results)
+            # the same text is only extracted once
+            self.assertEqual(2, len(mock_extract.call_args[0][0]))
+
+            self.assertEqual(results, self.service.extract_batch(docs))
+            self.assertEqual(results[0], self.service.extract(docs[0]))
+            self.assertEqual(1, mock_extract.call_count)
+        self.assertEqual(dict(hits=4, misses=3, entries=2), self.cache.stats())
+
+    def tearDown(self) -> None:
+        self.cache.truncate()
+
 
 class ProcessTest(unittest.TestCase):
     def test_process(self):
         process(is_test=True)
 
+    def test_process_rerun(self):
+        """ rerunning the ingestion must not store anything twice, from the checkpoint or from the start
+        :return:
+        """
+        ne_service = StanzaNERExtractionService.instance(is_test=True)
+        scrapper_service = ScrapyScrapperService.instance(is_test=True)
+
+        process(is_test=True)
+        n_spans = len(ne_service.ne_repo.find_all())
+        self.assertEqual(2, scrapper_service.load_checkpoint())
+
+        process(is_test=True, offset=0)
+        self.assertEqual(n_spans, len(ne_service.ne_repo.find_all()))
+        self.assertEqual(2, scrapper_service.load_checkpoint())
+
+    def test_process_resume(self):
+        """ a run resumed from the checkpoint of an interrupted one stops at the same end, and a rerun of a finished
+        one ingests nothing
+        :return:
+        """
+        texts = ["Alpha One", "Beta Two", "Gamma Three", "Delta Four"]
+        scrapper_service = ScrapyScrapperService.instance(is_test=True)
+
+        def extract_iter(date, offset=0, limit=None):
+            end = len(texts) if limit is None else offset + limit
+            return iter([RawDocument(date=date, text=text) for text in texts[offset:end]])
+
+        with mock.patch.object(scrapper_service, "extract_iter", side_effect=extract_iter):
+            # interrupted after the first document, the test run stops at 2
+            scrapper_service.store_checkpoint(1)
+            process(is_test=True)
+            self.assertEqual(2, scrapper_service.load_checkpoint())
+            process(is_test=True)
+            self.assertEqual(2, scrapper_service.load_checkpoint())
+
+        stored_ids = scrapper_service.db_document_repository.find_ids_by_content_hashes(
+            [Document(date=None, text=text).content_hash for text in texts]
+        )
+        self.assertEqual([Document(date=None, text="Beta Two").content_hash], list(stored_ids.keys()))
+
+    def test_process_parallel(self):
+        """ multi-process ingestion must produce the same documents and spans as the serial one
+        :return:
+        """
+        ne_service = StanzaNERExtractionService.instance(is_test=True)
+        doc_repo = ScrapyScrapperService.instance(is_test=True).db_document_repository
+
+        process(is_test=True, batch_size=1)
+        serial_spans = ne_service.ne_repo.find_all()
+        serial_texts = [doc.text for doc in doc_repo.find_by_ids([ner_span.document_id for ner_span in serial_spans])]
+        teardown_process()
+
+        process(is_test=True, batch_size=1, n_workers=2)
+        parallel_spans = ne_service.ne_repo.find_all()
+        parallel_texts = [doc.text for doc in doc_repo.find_by_ids([ner_span.document_id for ner_span in parallel_spans])]
+
+        self.assertEqual(serial_texts, parallel_texts)
+        self.assertEqual(
+            [(ner_span.start_span, ner_span.end_span, ner_span.ner_tag) for ner_span in serial_spans],
+            [(ner_span.start_span, ner_span.end_span, ner_span.ner_tag) for ner_span in parallel_spans]
+        )
+
+    def test_process_parallel_duplicates_across_shards(self):
+        """ a text repeated in a later shard is filtered by its worker before the earlier shard is stored, it must be
+        stored once without losing the other documents of the shard
+        :return:
+        """
+        texts = ["Alpha One", "Shared Text", "Beta Two", "Gamma Three", "Shared Text", "Delta Four"]
+        scrapper_service = ScrapyScrapperService.instance(is_test=True)
+        ne_service = StanzaNERExtractionService.instance(is_test=True)
+
+        def extract_iter(date, offset=0, limit=None):
+            return iter([RawDocument(date=date, text=text) for text in texts[offset:]])
+
+        with mock.patch.object(scrapper_service, "extract_iter", side_effect=extract_iter):
+            process(is_test=True, batch_size=3, offset=0)
+            serial_spans = ne_service.ne_repo.find_all()
+            teardown_process()
+
+            process(is_test=True, batch_size=3, n_workers=2, offset=0)
+            parallel_spans = ne_service.ne_repo.find_all()
+
+        stored_ids = scrapper_service.db_document_repository.find_ids_by_content_hashes(
+            [Document(date=None, text=text).content_hash for text in texts]
+        )
+        self.assertEqual(5, len(stored_ids))
+        self.assertEqual(
+            [(ner_span.start_span, ner_span.end_span, ner_span.ner_tag) for ner_span in serial_spans],
+            [(ner_span.start_span, ner_span.end_span, ner_span.ner_tag) for ner_span in parallel_spans]
+        )
+
     def tearDown(self) -> None:
         teardown_process()
         pass
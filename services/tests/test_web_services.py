@@ -0,0 +1,62 @@
+import json
+import subprocess
+import sys
+import unittest
+from datetime import datetime
+
+from models.models import Document
+from services.document_pages import document_page, earliest_starts
+
+HEAVY_MODULES = ["stanza", "torch", "datasets", "bs4"]
+
+# seconds, importing stanza and datasets alone takes several
+STARTUP_BUDGET = 2.0
+
+
+class DocumentPageTest(unittest.TestCase):
+
+    def test_earliest_starts(self):
+        self.assertEqual({1: 3, 2: 7, 3: 0}, earliest_starts([{1: 5, 2: 7}, {1: 3, 3: 0}, {}]))
+
+    def test_document_page(self):
+        docs = [Document(id=doc_id, date=datetime.now(), text="0123456789") for doc_id in [1, 2]]
+        self.assertEqual((docs, 2), document_page([1, 2], docs, limit=2))
+        self.assertEqual((docs, None), document_page([1, 2], docs, limit=3))
+
+        snippets, next_cursor = document_page([1, 2], docs, limit=3, starts={2: 9}, snippet_size=4)
+        self.assertIsNone(next_cursor)
+        self.assertEqual([(1, 0, "0123"), (2, 6, "6789")],
+                         [(snippet.id, snippet.offset, snippet.text) for snippet in snippets])
+
+
+class WebServiceStartupTest(unittest.TestCase):
+
+    def _import_in_subprocess(self, module: str) -> dict:
+        """ import module in a fresh interpreter, so that nothing is already loaded by the other tests
+
+        :param module:
+        :return: import time in seconds, and the heavy modules that got loaded
+        """
+        code = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "elapsed = time.perf_counter() - start\n"
+            f"print(json.dumps(dict(elapsed=elapsed, loaded=[m for m in {HEAVY_MODULES!r} if m in sys.modules])))\n"
+        )
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        return json.loads(output.splitlines()[-1])
+
+    def test_web_services_do_not_load_ingestion_libraries(self):
+        result = self._import_in_subprocess("services.web_services")
+        self.assertEqual([], result["loaded"])
+        self.assertLess(result["elapsed"], STARTUP_BUDGET)
+
+    def test_ingestion_services_load_libraries_lazily(self):
+        result = self._import_in_subprocess("services.services")
+        self.assertEqual([], result["loaded"])
+        self.assertLess(result["elapsed"], STARTUP_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
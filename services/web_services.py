@@ -0,0 +1,220 @@
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Text, Tuple
+
+from models.models import Document, NERCategoryStats
+from repositories.category_query import CategoryTerm, parse_category_query
+from repositories.indexes import NERCategoryIndex, NERCategoryDictionary
+from repositories.repositories import CachedDocumentRepository, SQLDocumentRepositoryImpl, SQLNERSpanRepository, \
+    database_replicas, database_settings
+from services.document_pages import document_page, earliest_starts
+
+
+class WebService(ABC):
+
+    @abstractmethod
+    def retrieve_related_ner_categories(self, search_term: str) -> List[str]:
+        pass
+
+    @abstractmethod
+    def retrieve_related_ner_category_stats(self, search_term: str) -> List[NERCategoryStats]:
+        pass
+
+    @abstractmethod
+    def retrieve_category_stats(self, ner_categories: Optional[List[str]] = None) -> List[NERCategoryStats]:
+        pass
+
+    @abstractmethod
+    def retrieve_related_documents(self, search_term: str) -> List[Document]:
+        pass
+
+    @abstractmethod
+    def iter_related_documents(self, search_term: str) -> Iterator[Document]:
+        pass
+
+    @abstractmethod
+    def retrieve_related_documents_page(self, search_term: str, after: Optional[int] = None, limit: int = 100,
+                                        snippet_size: Optional[int] = None) -> Tuple[List[Document], Optional[int]]:
+        pass
+
+    @abstractmethod
+    def retrieve_documents_by_entity_page(self, entity_text: str, ner_category: Optional[str] = None,
+                                          after: Optional[int] = None, limit: int = 100,
+                                          snippet_size: Optional[int] = None) -> Tuple[List[Document], Optional[int]]:
+        pass
+
+
+class WebServiceImpl(WebService):
+    INSTANCE = None
+
+    @staticmethod
+    def instance(is_test=False, use_category_index=False):
+        if not WebServiceImpl.INSTANCE:
+            WebServiceImpl.INSTANCE = WebServiceImpl(is_test=is_test, use_category_index=use_category_index)
+
+        return WebServiceImpl.INSTANCE
+
+    def __init__(self, is_test=False, use_category_index=False, index_refresh_interval=60.0,
+                 document_cache_max_bytes=None):
+        """
+
+        :param is_test:
+        :param use_category_index: if True, documents are looked up by category through an in-memory NERCategoryIndex
+            and related categories through an in-memory NERCategoryDictionary, both built here, instead of querying the
+            db on every call
+        :param index_refresh_interval: minimum number of seconds between two refreshes of the in-memory indexes
+        :param document_cache_max_bytes: size of the CachedDocumentRepository that documents are read through, see
+            CachedDocumentRepository for the default. 0 disables the cache.
+        """
+        # reads are spread over the replicas of the primary database, if any, see SQLRepository.read_engine
+        self.db_document_repository = SQLDocumentRepositoryImpl.instance(**database_settings(is_test),
+                                                                         replicas=database_replicas(is_test))
+        self.ner_repository = SQLNERSpanRepository.instance(**database_settings(is_test),
+                                                            replicas=database_replicas(is_test))
+
+        self.document_cache = CachedDocumentRepository(self.db_document_repository, max_bytes=document_cache_max_bytes)
+        if self.document_cache.max_bytes > 0:
+            self.db_document_repository = self.document_cache
+        else:
+            self.document_cache = None
+
+        self.category_index = None
+        self.category_dictionary = None
+        if use_category_index:
+            self.category_index = NERCategoryIndex(self.ner_repository, refresh_interval=index_refresh_interval)
+            self.category_index.refresh()
+            self.category_dictionary = NERCategoryDictionary(self.ner_repository,
+                                                             refresh_interval=index_refresh_interval)
+            self.category_dictionary.refresh()
+
+    def retrieve_related_ner_categories(self, search_term: str) -> List[str]:
+        if self.category_dictionary is None:
+            return self.ner_repository.find_related_ner_categories(search_term)
+
+        self.category_dictionary.refresh_if_stale()
+        return self.category_dictionary.find_related_ner_categories(search_term)
+
+    def retrieve_related_ner_category_stats(self, search_term: Text) -> List[NERCategoryStats]:
+        """ same as retrieve_related_ner_categories, with the number of documents and mentions of each category
+
+        :param search_term:
+        :return:
+        """
+        return self.ner_repository.find_category_stats(self.retrieve_related_ner_categories(search_term))
+
+    def retrieve_category_stats(self, ner_categories: Optional[List[Text]] = None) -> List[NERCategoryStats]:
+        """ facet counts: number of documents and mentions of each of ner_categories, read at once from the stats
+        maintained by ingestion
+
+        :param ner_categories: None for every category
+        :return:
+        """
+        return self.ner_repository.find_category_stats(ner_categories)
+
+    def retrieve_related_documents(self, search_term: Text) -> List[Document]:
+        """ documents that match search_term, either a ner category or a boolean query over categories such as
+        `PERSON AND LAW`, see parse_category_query. Invalid queries raise InvalidCategoryQuery.
+
+        :param search_term:
+        :return:
+        """
+        doc_ids = self._find_document_ids_by_ner_category(search_term)
+        docs = self.db_document_repository.find_by_ids(doc_ids)
+        return docs
+
+    def iter_related_documents(self, search_term: Text) -> Iterator[Document]:
+        """ same as retrieve_related_documents, but the documents are streamed from the db in ascending id order instead
+        of being loaded all at once.
+
+        :param search_term:
+        :return:
+        """
+        doc_ids = self._find_document_ids_by_ner_category(search_term)
+        return self.db_document_repository.iter_by_ids(doc_ids)
+
+    def retrieve_related_documents_page(self, search_term: Text, after: Optional[int] = None, limit: int = 100,
+                                        snippet_size: Optional[int] = None) -> Tuple[List[Document], Optional[int]]:
+        """ keyset paginated retrieve_related_documents, documents are ordered by id.
+
+        :param search_term:
+        :param after: cursor returned with the previous page, None for the first page
+        :param limit:
+        :param snippet_size: if set, return DocumentSnippet of at most snippet_size characters around the first span of
+            search_term instead of the full documents
+        :return: the documents of the page, and the cursor of the next page or None if this is the last page
+        """
+        query = parse_category_query(search_term)
+        if not isinstance(query, CategoryTerm):
+            doc_ids = self._find_document_ids_by_category_query(search_term, after=after, limit=limit)
+        elif self.category_index is None:
+            doc_ids = self.ner_repository.find_document_ids_by_ner_category_page(query.ner_category, after=after,
+                                                                                 limit=limit)
+        else:
+            self.category_index.refresh_if_stale()
+            doc_ids = self.category_index.find_document_ids_page(query.ner_category, after=after, limit=limit)
+
+        if len(doc_ids) == 0:
+            return [], None
+
+        docs = self.db_document_repository.find_by_ids_page(doc_ids, limit=limit)
+        span_starts = None
+        if snippet_size is not None:
+            # the first span of any category of the query
+            span_starts = earliest_starts(
+                self.ner_repository.find_first_span_starts(ner_category, [doc.id for doc in docs])
+                for ner_category in sorted(query.categories())
+            )
+        return document_page(doc_ids, docs, limit, starts=span_starts, snippet_size=snippet_size)
+
+    def retrieve_documents_by_entity_page(self, entity_text: Text, ner_category: Optional[Text] = None,
+                                          after: Optional[int] = None, limit: int = 100,
+                                          snippet_size: Optional[int] = None) -> Tuple[List[Document], Optional[int]]:
+        """ keyset paginated documents that mention entity_text, ordered by id. Entities are matched regardless of
+        case and whitespace.
+
+        :param entity_text: surface text of the entity, for example Obama
+        :param ner_category: if set, only mentions of this category
+        :param after: cursor returned with the previous page, None for the first page
+        :param limit:
+        :param snippet_size: if set, return DocumentSnippet of at most snippet_size characters around the first mention
+            of entity_text instead of the full documents
+        :return: the documents of the page, and the cursor of the next page or None if this is the last page
+        """
+        doc_ids = self.ner_repository.find_document_ids_by_entity_page(entity_text, ner_category=ner_category,
+                                                                       after=after, limit=limit)
+        if len(doc_ids) == 0:
+            return [], None
+
+        docs = self.db_document_repository.find_by_ids_page(doc_ids, limit=limit)
+        entity_starts = None
+        if snippet_size is not None:
+            entity_starts = self.ner_repository.find_first_entity_starts(entity_text, ner_category,
+                                                                         [doc.id for doc in docs])
+        return document_page(doc_ids, docs, limit, starts=entity_starts, snippet_size=snippet_size)
+
+    def _find_document_ids_by_ner_category(self, search_term: Text) -> List[int]:
+        query = parse_category_query(search_term)
+        if not isinstance(query, CategoryTerm):
+            return self._find_document_ids_by_category_query(search_term)
+
+        if self.category_index is None:
+            return self.ner_repository.find_document_ids_by_ner_category(query.ner_category)
+
+        self.category_index.refresh_if_stale()
+        return self.category_index.find_document_ids(query.ner_category)
+
+    def _find_document_ids_by_category_query(self, search_term: Text, after: Optional[int] = None,
+                                             limit: Optional[int] = None) -> List[int]:
+        """ ids of the documents that match a boolean category query, merged from the posting lists of the in-memory
+        index if there is one, or grouped by document in the db
+
+        :param search_term:
+        :param after:
+        :param limit:
+        :return:
+        """
+        query = parse_category_query(search_term)
+        if self.category_index is None:
+            return self.ner_repository.find_document_ids_by_category_query(query, after=after, limit=limit)
+
+        self.category_index.refresh_if_stale()
+        return self.category_index.find_document_ids_by_query(query, after=after, limit=limit)
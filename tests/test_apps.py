@@ -0,0 +1,78 @@
+import os
+import unittest
+from datetime import datetime
+
+from prometheus_client import REGISTRY
+from starlette.testclient import TestClient
+
+from models.models import Document, NERSpan
+from services.web_services import WebServiceImpl
+
+# both apps create their web service when they are imported, the flask one on the test db set here
+WebServiceImpl.INSTANCE = WebServiceImpl(is_test=True, index_refresh_interval=0)
+os.environ["ASGI_TEST_DB"] = "1"
+
+import app  # noqa: E402
+import asgi  # noqa: E402
+
+
+def request_count(route, method="POST", status="200"):
+    return REGISTRY.get_sample_value(
+        "ling_508_http_request_seconds_count", dict(route=route, method=method, status=status)
+    ) or 0
+
+
+def serialization_count(route):
+    return REGISTRY.get_sample_value("ling_508_http_serialization_seconds_count", dict(route=route)) or 0
+
+
+class DocumentSearchTest(unittest.TestCase):
+    web_service = WebServiceImpl.INSTANCE
+
+    def setUp(self) -> None:
+        self.docs = [Document(date=datetime.now(), text=f"Obama number {i}") for i in range(3)]
+        self.web_service.db_document_repository.store_many(self.docs)
+        self.web_service.ner_repository.store_many([
+            NERSpan.of(document_id=doc.id, start_span=0, end_span=5, ner_tag="S-PERSON", entity_text="Obama")
+            for doc in self.docs
+        ])
+
+    def test_search_page_after_only(self):
+        """ a payload with only after is paginated, with the default page size
+        """
+        payload = {"ner_category": "PERSON", "after": self.docs[0].id}
+        expected = dict(data=[{"id": doc.id, "text": doc.text} for doc in self.docs[1:]], next=None)
+
+        self.assertEqual(expected, app.app.test_client().post("/documents/search", json=payload).get_json())
+        with TestClient(asgi.app) as client:
+            self.assertEqual(expected, client.post("/documents/search", json=payload).json())
+
+    def test_search_stream_request_time(self):
+        """ a streamed search is timed once, when its whole body is sent
+        """
+        payload = {"ner_category": "PERSON", "stream": True}
+        expected = dict(data=[{"id": doc.id, "text": doc.text} for doc in self.docs])
+
+        count = request_count("/documents/search")
+        self.assertEqual(expected, app.app.test_client().post("/documents/search", json=payload).get_json())
+        self.assertEqual(count + 1, request_count("/documents/search"))
+        with TestClient(asgi.app) as client:
+            self.assertEqual(expected, client.post("/documents/search", json=payload).json())
+        self.assertEqual(count + 2, request_count("/documents/search"))
+
+    def test_search_serialization_time(self):
+        count = serialization_count("/documents/search")
+        with TestClient(asgi.app) as client:
+            client.post("/documents/search", json={"ner_category": "PERSON"})
+            client.post("/documents/search", json={"ner_category": "PERSON", "limit": 2})
+        self.assertEqual(count + 2, serialization_count("/documents/search"))
+
+    def tearDown(self) -> None:
+        if self.web_service.document_cache is not None:
+            self.web_service.document_cache.clear()
+        self.web_service.ner_repository.truncate()
+        self.web_service.db_document_repository.truncate()
+
+
+if __name__ == '__main__':
+    unittest.main()